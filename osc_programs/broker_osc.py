@@ -1,138 +1,2230 @@
 #---------------------------------------------------------
-# CAFFEINE POD PYTHON BROKER PROGRAM (v1.10)
-#   - Pod status dashboard (one line per pod)
-#   - Dynamic /list of *active* pods
+# CAFFEINE POD PYTHON BROKER PROGRAM (v1.13)
+#   - Pod status dashboard (one line per pod, msg & fan-out
+#     rates); redraws only changed lines; --no-dashboard
+#     for headless runs
+#   - Dynamic /list of *active* pods, plus pod_up / pod_down
+#     pushes so clients needn't poll it
 #   - Protocol:
-#       1) /register, recvPort         (stores client info)
-#          (or /register with no args: uses sending port)
+#       1) /register, recvPort [, "bundle", ms]
+#          (or /register with no args: uses sending port;
+#           "bundle", ms coalesces this client's pod data into
+#           one OSC bundle per ms-long window)
 #       2) /list                       (no args)
-#       3) /connect, pod_name          (e.g. "/pod1")
-#       4) /disconnect, pod_name
+#       3) /connect, pod_name [, pod_name ...] [, field ...]
+#                    [, "rate", hz [, "avg"]] [, "multicast"]
+#          (e.g. "/pod1", or "/pod1", "x", "y" to receive only
+#           those fields: x y z sound distance light; "rate", 30
+#           caps the stream at 30 Hz using the latest value, or
+#           the average of the skipped samples with "avg";
+#           "multicast" receives the stream on the broker's
+#           multicast group (--multicast-group) instead;
+#           pod names may be OSC patterns: "/pod*", "/pod[1-4]",
+#           "/pod{1,7}", also matching pods that appear later)
+#       4) /disconnect, pod_name [, pod_name ...]
+#       5) /history, pod_name, seconds (replay recent samples)
+#       6) /latency [, pod_name ...]  (latency percentiles)
+#       7) /heartbeat [, recvPort]    (renews the client's lease;
+#          any control message does)
 #   - No duplicate client entries
 #   - All announcements on /broker:
 #       /broker, "registered", ip, port
 #       /broker, "pod_list", pod1, pod2, ...
+#       /broker, "history", pod_name, n    (n samples follow,
+#           as bundles of /history/podN, time, v1..v6)
+#       /broker, "history_end", pod_name, n
+#       /broker, "latency", pod_name, metric, n, p50, p99, p99.9,
+#           max    (ms; metric "fanout" or "jitter")
+#       /broker, "pod_up", pod_name    (pushed to every client when
+#       /broker, "pod_down", pod_name   a pod starts/stops sending)
+#       /broker, "unregistered"       (reply to /heartbeat from an
+#           unknown client: /register again)
+#       /broker, "evicted", "timeout" (lease ran out)
+#       /broker, "multicast", pod_name, group, port  (join group
+#           and listen on port for the stream; sent on every
+#           /connect with "multicast")
+#       /broker, "multicast_off", pod_name  (no multicast group
+#           configured: the stream comes by unicast)
+#   - Client leases (--client-timeout) and eviction of clients
+#     whose port is unreachable (ICMP errors, Linux); idle pods
+#     forgotten after --pod-timeout; MAX_PODS / MAX_CLIENTS caps
+#   - Per-client bounded send queues: pod data goes out without
+#     blocking; a client that backs up is queued and drained by
+#     its send lane (own socket, --senders), dropping per
+#     --send-policy, with drop/error counts on the dashboard
+#   - Multicast egress: one send per stream to an IP multicast
+#     group, whatever the number of listeners (--multicast-group;
+#     test on loopback with --multicast-if 127.0.0.1)
+#   - Optional Prometheus metrics endpoint (--metrics-port):
+#     per-pod message/send counters and latency, per-client
+#     sends, errors, drops and queue depth, lock waits
+#   - Optional data path profile (--profile): time per stage
+#     (parse, decode, state, route, send, log) printed on
+#     shutdown, plus sampled stacks for a flame graph
+#     (--profile-stacks PATH)
+#   - Passthrough forwarding: pod datagrams are routed by
+#     address alone and sent to subscribers unchanged (full
+#     precision) unless fields or a rate were selected
+#   - Per-pod ring-buffer history of the last N seconds
+#     (--history-seconds, needs NumPy)
+#   - Per-pod latency histograms (fan-out time, inter-arrival
+#     jitter) with p50/p99/p99.9 on the dashboard and /latency
+#   - Optional binary log of every pod message (--log PREFIX,
+#     written off the data path; see caffeine_binlog.py)
+#   - Raw ESP32 traffic capture for hardware-free replay
+#     (--capture PATH; see pod_capture.py)
 #   - Clean shutdown instructions on dashboard
+#   - Runtimes (--engine):
+#       threads  (default) ESP32 ingest, control and dashboard
+#                each on an OS thread
+#       asyncio  all three on one asyncio event loop
+#   - ESP32 ingest modes for the thread engine (--ingest-mode):
+#       batched  (default) one thread owns the socket and drains
+#                many datagrams per wakeup
+#       threaded original ThreadingOSCUDPServer (thread per packet)
+#     with a 1 MB receive buffer (--rcvbuf, also asyncio)
+#   - Sharded ingest (--workers N): N processes share the ESP32
+#     port via SO_REUSEPORT; subscriptions replicated to each
 #---------------------------------------------------------
 
-from pythonosc import dispatcher, osc_server, udp_client
+from pythonosc import dispatcher, osc_server
+from pythonosc import osc_message, osc_message_builder, osc_packet
+import argparse
+import asyncio
+import array
+import errno
+import heapq
+import http.server
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import select
+import shutil
+import signal
+import socket
+import struct
 import threading
 import time
 import sys
-from collections import defaultdict
+from collections import defaultdict, deque, namedtuple
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:  # only the /history ring buffers need NumPy
+    np = None
 
 HOST = '0.0.0.0'
 ESP32_PORT = 5001          # ESP32 -> broker data
 BROKER_OSC_PORT = 9001     # Client <-> broker (control)
 
-# How long a pod can be silent before we consider it "inactive"
-POD_ACTIVE_TIMEOUT = 5.0  # seconds
+# How long a pod can be silent before we consider it "inactive"
+POD_ACTIVE_TIMEOUT = 5.0  # seconds
+
+# Broker runtimes selectable with --engine
+ENGINES = ("threads", "asyncio")
+
+# ESP32 ingest engines selectable with --ingest-mode (thread engine)
+INGEST_MODES = ("batched", "threaded")
+
+# Batched ingest: max datagrams drained per wakeup, and the kernel
+# receive buffer of the data port (--rcvbuf). The buffer absorbs bursts
+# but is also where datagrams wait once ingest falls behind: on Linux
+# 1 MB holds ~2,500 pod datagrams (~830 bytes of buffer each), 250 ms
+# of 100 pods at 100 Hz. Smaller buffers dropped bursts in
+# ingest_bench's flood; 4 MB held ~10,000, seconds of queueing when
+# overloaded (see utilities/benchmarks/readme.md).
+INGEST_BATCH_SIZE = 256
+INGEST_RCVBUF_BYTES = 1024 * 1024
+
+# Per-pod history ring buffers (--history-seconds; 0 disables).
+# Capacity is seconds * HISTORY_SAMPLE_RATE samples of HISTORY_WIDTH
+# values, preallocated when a pod first appears, so memory per pod is
+# fixed. Pods sending faster than the nominal rate get a shorter window.
+HISTORY_SECONDS = 10.0
+HISTORY_SAMPLE_RATE = 100   # Hz, firmware sends every 10 ms
+HISTORY_WIDTH = 6           # x, y, z, sound, distance, light
+HISTORY_MAX_SECONDS = 60.0  # cap on what a /history request may ask for
+HISTORY_BUNDLE_SIZE = 20    # messages per reply bundle (~1.2 KB, < MTU)
+HISTORY_RAW_BYTES = 64      # slot per raw datagram (the firmware's are 40)
+
+# Outbound coalescing (/register, recvPort, "bundle", ms): allowed
+# window range, and the size at which a bundle is sent early so it
+# stays within one Ethernet/WiFi frame
+COALESCE_MAX_MS = 100.0
+COALESCE_MAX_BYTES = 1400
+
+# Outbound queues (see OUTBOUND QUEUES): pod data waiting per client
+# while sends to it back up (--send-queue), what a full queue drops
+# (--send-policy), and the number of send lanes, each a sender with
+# its own socket (--senders)
+SEND_QUEUE_DEPTH = 64
+SEND_POLICIES = ("drop-oldest", "latest")
+SEND_POLICY = "drop-oldest"
+SENDER_LANES = 4
+
+# Multicast egress (/connect, pod, "multicast"): with a group set
+# (--multicast-group), each multicast stream (a pod with one set of
+# /connect options) is sent once to that group, on its own UDP port
+# counting up from MULTICAST_PORT, however many clients listen.
+# Without a group, such subscriptions fall back to unicast.
+MULTICAST_GROUP = None       # e.g. "239.255.67.1"
+MULTICAST_PORT = 7001
+MULTICAST_TTL = 1            # stay on the local network
+MULTICAST_INTERFACE = None   # local IP to send from (--multicast-if);
+                             # None = per the routing table
+
+# Latency histograms: values in microseconds, exact below
+# 2**(LATENCY_SUB_BITS + 1) us, then 2**LATENCY_SUB_BITS buckets per
+# power of two (<= 6.25 % error) up to 2**LATENCY_MAX_BITS us (~67 s)
+LATENCY_SUB_BITS = 4
+LATENCY_MAX_BITS = 26
+LATENCY_BUCKETS = (LATENCY_MAX_BITS - LATENCY_SUB_BITS + 1) << LATENCY_SUB_BITS
+LATENCY_PERCENTILES = (0.50, 0.99, 0.999)
+
+# --profile: stages of the pod data path timed per message (see
+# PROFILING), and how often --profile-stacks samples every thread
+PROFILE_STAGES = ("parse", "decode", "state", "route", "send", "log", "handler")
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds
+
+# Sharded ingest (--workers N): how often each worker reports its
+# pod status back to the main process for the dashboard and /list
+WORKER_STATUS_INTERVAL = 0.25  # seconds
+
+# Liveness (see the LIVENESS section). A client's lease is renewed by
+# /register, /heartbeat or any other control message; with
+# --client-timeout > 0 it is evicted when the lease runs out. Clients
+# whose port answers with ICMP errors for CLIENT_UNREACHABLE_SECONDS
+# are evicted regardless. Pods silent for --pod-timeout seconds are
+# forgotten (they reappear when they send again), and at most MAX_PODS
+# pods / MAX_CLIENTS clients are tracked, so stray senders can't grow
+# memory without bound.
+CLIENT_TIMEOUT = 0.0        # seconds; 0 = leases never expire
+CLIENT_UNREACHABLE_SECONDS = 5.0
+POD_TIMEOUT = 300.0         # seconds; 0 = keep pods forever
+MAX_PODS = 1024
+MAX_CLIENTS = 1024
+LIVENESS_INTERVAL = 1.0     # seconds between janitor passes
+
+# Linux: ask for ICMP errors (port/host unreachable) on the egress
+# socket's error queue. Not every Python exposes the constants.
+IP_RECVERR = getattr(socket, "IP_RECVERR", 11)
+MSG_ERRQUEUE = getattr(socket, "MSG_ERRQUEUE", 0x2000)
+UNREACHABLE_ERRNOS = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+class TimedLock:
+    """
+    A threading.Lock for `with` blocks that also counts the entries
+    that had to wait, and the seconds spent waiting (for /metrics).
+    Uncontended entries cost one non-blocking acquire; acquire() and
+    release() are passed through untimed (e.g. for a Condition).
+    """
+
+    __slots__ = ("name", "lock", "acquire", "release", "waits", "wait_seconds")
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.acquire = self.lock.acquire
+        self.release = self.lock.release
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def __enter__(self):
+        if not self.acquire(False):
+            t0 = time.perf_counter()
+            self.acquire()
+            self.wait_seconds += time.perf_counter() - t0
+            self.waits += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+# Locks reported by /metrics, by name
+timed_locks = {}
+
+
+def new_timed_lock(name):
+    lock = timed_locks[name] = TimedLock(name)
+    return lock
+
+
+# Map (ip, port) -> time.time() of the client's last /register or other
+# control message (its lease)
+clients = {}
+
+# Map (ip, port) -> [first, last] time.time() of the ICMP errors seen
+# for that client since it was last heard from
+client_unreachable = {}
+
+# One UDP socket shared by all outbound traffic (replies and pod data),
+# so descriptors don't grow with the number of clients
+egress_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+# Map (ip, port) -> coalescing window in seconds, for clients that
+# asked for bundled delivery in /register
+client_bundle_window = {}
+
+# Map ip -> (ip, port) of last registered client on that IP
+last_registered_for_ip = {}
+
+# Names of the values a pod sends, in firmware order; /connect can
+# select a subset of these by name (or by index)
+POD_FIELDS = ("x", "y", "z", "sound", "distance", "light")
+
+# Decimation modes for rate-limited subscriptions
+DECIMATION_MODES = ("latest", "avg")
+
+# Per-client options for one pod subscription:
+#   fields: tuple of value indices to forward, or None for all
+#   rate:   max messages/s forwarded, or None for every sample
+#   mode:   "latest" (forward the newest sample when due) or
+#           "avg" (forward the mean of the samples since the last send)
+#   multicast: True to receive the stream on a multicast group
+Subscription = namedtuple("Subscription", ["fields", "rate", "mode", "multicast"],
+                          defaults=(None, None, "latest", False))
+FULL_SUBSCRIPTION = Subscription()
+
+# One forwarding group in the routing table: every destination gets
+# the same bytes. `dests` are sent to directly; `batched` holds
+# ((ip, port), window_s) pairs for clients using bundle coalescing.
+# `project` is the precompiled field selection (None = forward all
+# values) and `decimator` the rate limiter shared by the group
+# (None = full rate). For a multicast stream, `dests` is the single
+# (group, port) and `listeners` the subscribed clients. `sent` is a
+# one-item list counting the messages the route has sent, folded into
+# client_sent when the routing table is replaced.
+Route = namedtuple("Route", ["sub", "project", "dests", "batched", "decimator",
+                             "listeners", "sent"], defaults=((), None))
+
+# Subscriptions:
+#   pod_subscriptions[pod_name] = set of (ip, port) keys
+#   client_subscriptions[(ip, port)] = {pod_name: Subscription}
+pod_subscriptions = defaultdict(set)
+client_subscriptions = defaultdict(dict)
+
+# Pattern subscriptions ("/pod*", "/pod[1-4]"), compiled once in
+# /connect and resolved per pod when the pod is first seen, so the
+# data path never matches patterns:
+#   client_patterns[(ip, port)] = {pattern: (match_fn, Subscription)}
+#   pattern_routes[pod_name] = {(ip, port): Subscription}
+#   pattern_exclusions[(ip, port)] = {pod_name, ...} the client's
+#       patterns match but it /disconnected by name
+# A literal /connect for a pod overrides a matching pattern (and
+# lifts an exclusion), as does connecting a pattern again.
+client_patterns = defaultdict(dict)
+pattern_routes = defaultdict(dict)
+pattern_exclusions = defaultdict(set)
+
+# Map (pod_name, Subscription) -> UDP port of its multicast stream,
+# kept while the stream has listeners
+multicast_ports = {}
+
+# Copy-on-write routing snapshot read by the data path without locking:
+#   routing_table[pod_name] = tuple of Route, one per distinct
+#   Subscription among that pod's subscribers
+# Never mutated in place; rebuilt under state_lock and swapped in by a
+# single assignment whenever /register, /connect or /disconnect
+# changes the subscriptions.
+routing_table = {}
+
+# Copy-on-write view of the control-plane tables for the dashboard,
+# published together with routing_table:
+#   client_view["clients"][(ip, port)] = sorted tuple of pod names
+#   client_view["last_registered"][ip] = (ip, port)
+#   client_view["bundle_window"][(ip, port)] = seconds
+client_view = {"clients": {}, "last_registered": {}, "bundle_window": {}}
+
+# Sharded ingest: pipes to the worker processes. Every new routing
+# snapshot is replicated to each of them.
+worker_route_conns = []
+# ... preceded by the pattern subscriptions when they changed (see
+# pattern_snapshot()), so a worker can route a pod it sees first
+# without waiting for the main process. routes_from_main is True in
+# the workers.
+replicated_patterns = None
+routes_from_main = False
+
+# Map pod name -> PodState (last data, counters, history ring buffer
+# and latency histograms; see PodState)
+pod_status = {}
+
+# Optional per-message binary log (--log): the BinaryLogger, and its
+# log() method for the data path (None when logging is off)
+data_logger = None
+data_log = None
+
+# Optional raw capture of ESP32 datagrams (--capture): the CaptureWriter,
+# and its write() method for the ingest path (None when off)
+capture_writer = None
+capture_write = None
+
+# --profile: the StageProfile the data path times its stages into, and
+# the StackSampler of --profile-stacks (None when off)
+profile_stages = None
+profile_sampler = None
+
+# Pod directory: pods that sent data within POD_ACTIVE_TIMEOUT, and
+# a min-heap of (deadline, pod_name) with one entry per live pod, so
+# checking liveness only touches pods whose deadline has passed.
+# Clients are told of changes with /broker "pod_up" / "pod_down".
+# Ingest workers leave this to the main process (track_pod_liveness).
+live_pods = set()
+liveness_heap = []
+directory_lock = new_timed_lock("directory")
+track_pod_liveness = True
+
+# Bumped on every pod_up / pod_down; get_active_pods() reuses its last
+# result while neither this nor the routing_table snapshot changed:
+#   active_pods_cache = (directory_version, routing_table, sorted list)
+directory_version = 0
+active_pods_cache = (None, None, [])
+
+# Set once the MAX_PODS warning has been printed
+pod_limit_warned = False
+
+# Set once a datagram that broke the ingest handler has been reported
+ingest_error_warned = False
+
+# Guards clients, last_registered_for_ip and the subscription tables
+# (control plane + dashboard). The pod data path never takes it.
+state_lock = new_timed_lock("state")
+
+
+# ---------------------------------------------------------
+#  HELPER FUNCTIONS
+# ---------------------------------------------------------
+
+# OSC type tags the fast encoder/decoder handles, with their struct
+# codes. Python values are tagged as python-osc would tag them.
+OSC_STRUCT_CODES = {"f": "f", "i": "i", "d": "d", "h": "q"}
+OSC_TAG_FOR_TYPE = {float: "f", int: "i"}
+OSC_FORMAT_CACHE_SIZE = 4096  # > MAX_PODS: one layout per pod address
+
+# Caches of precompiled layouts (bounded: cleared when full):
+#   osc_arg_structs[b",fffifi"] = struct.Struct for the arguments, or
+#       None if a tag needs python-osc
+#   osc_msg_formats[(address, type, type, ...)] = (address + type tag
+#       bytes, struct.Struct), or None for python-osc
+osc_arg_structs = {}
+osc_msg_formats = {}
+
+
+def osc_string(text):
+    b = text.encode() + b"\0"
+    return b + b"\0" * (-len(b) % 4)
+
+
+def encode_osc_message(address, args):
+    """
+    Encode an OSC message once; the resulting bytes can be sent to any
+    number of destinations. Messages of floats and 32-bit ints (pod
+    data) are packed with a cached struct layout; anything else goes
+    through python-osc. Returns None if args can't be encoded (e.g.
+    values decoded from a malformed pod message).
+    """
+    if not isinstance(args, (list, tuple)):
+        args = (args,)
+    kinds = (address, *map(type, args))
+    fmt = osc_msg_formats.get(kinds, False)
+    if fmt is False:
+        tags = [OSC_TAG_FOR_TYPE.get(kind) for kind in kinds[1:]]
+        if None in tags:
+            fmt = None
+        else:
+            fmt = (osc_string(address) + osc_string("," + "".join(tags)),
+                   struct.Struct(">" + "".join(OSC_STRUCT_CODES[t] for t in tags)))
+        if len(osc_msg_formats) >= OSC_FORMAT_CACHE_SIZE:
+            osc_msg_formats.clear()
+        osc_msg_formats[kinds] = fmt
+    if fmt is not None:
+        head, layout = fmt
+        try:
+            return head + layout.pack(*args)
+        except (struct.error, OverflowError):
+            pass  # e.g. an int beyond 32 bits
+    try:
+        return osc_message_builder.build_msg(address, args).dgram
+    except (osc_message_builder.BuildError, ValueError, OverflowError):
+        return None
+
+
+def pod_datagram_address(data):
+    """
+    Return the address of a plain OSC message datagram, reading nothing
+    else, or None if it doesn't look like one (bundles included).
+    """
+    if data[:1] != b"/" or len(data) & 3:
+        return None
+    end = data.find(b"\0")
+    if end < 0 or data[(end + 4) & ~3:((end + 4) & ~3) + 1] != b",":
+        return None
+    try:
+        return data[:end].decode()
+    except UnicodeDecodeError:
+        return None
+
+
+def decode_osc_values(data):
+    """
+    Return the arguments of a plain OSC message datagram as a tuple, or
+    None if it is malformed. Numeric type tags are unpacked with a
+    cached struct layout; other tags go through python-osc.
+    """
+    start = (data.find(b"\0") + 4) & ~3
+    end = data.find(b"\0", start)
+    if end < 0:
+        return None
+    tags = data[start:end]
+    layout = osc_arg_structs.get(tags, False)
+    if layout is False:
+        codes = [OSC_STRUCT_CODES.get(chr(t)) for t in tags[1:]]
+        layout = None if None in codes else struct.Struct(">" + "".join(codes))
+        if len(osc_arg_structs) >= OSC_FORMAT_CACHE_SIZE:
+            osc_arg_structs.clear()
+        osc_arg_structs[tags] = layout
+    if layout is not None:
+        try:
+            return layout.unpack_from(data, (end + 4) & ~3)
+        except struct.error:
+            return None
+    try:
+        return tuple(osc_message.OscMessage(data).params)
+    except (osc_message.ParseError, UnicodeDecodeError, ValueError):
+        return None
+
+
+# "#bundle" + timetag 1 ("immediately")
+OSC_BUNDLE_HEAD = b"#bundle\0" + struct.pack(">Q", 1)
+
+
+def encode_osc_bundle(dgrams):
+    """
+    Wrap already-encoded OSC messages in a single OSC bundle.
+    """
+    return OSC_BUNDLE_HEAD + b"".join(struct.pack(">i", len(d)) + d
+                                      for d in dgrams)
+
+
+def retry_send(data, key, error, sock=None):
+    """
+    Handle an error from sendto() on an egress socket (default: the
+    shared one): returns None if the datagram was resent, else the
+    error to report. Besides OSError, sendto() raises OverflowError for
+    a port beyond 65535.
+
+    With IP_RECVERR on (Linux), an ICMP error for one client fails the
+    next send to *any* destination with ECONNREFUSED, so those sends are
+    retried once, without blocking; the ICMP error itself is read from
+    the error queue by drain_egress_errors().
+    """
+    if getattr(error, "errno", None) == errno.ECONNREFUSED:
+        try:
+            (sock or egress_sock).sendto(data, socket.MSG_DONTWAIT, key)
+            return None
+        except (OSError, OverflowError) as e:
+            return e
+    return error
+
+
+def send_to_client(key, address, args):
+    """
+    Send a single OSC message to the client at key = (ip, port), in
+    order with its pod data (see send_datagram).
+    """
+    dgram = encode_osc_message(address, args)
+    if dgram is not None:
+        send_datagram(key, None, dgram)
+
+
+def register_client(ip: str, recv_port: int, bundle_window=None):
+    """
+    Record (ip, recv_port) as a client and as the "last registered"
+    client for this IP. bundle_window (seconds) turns on outbound
+    coalescing for this client; None turns it off. Returns the client
+    key, or None if MAX_CLIENTS are already registered.
+    """
+    key = (ip, recv_port)
+    with state_lock:
+        if key not in clients and len(clients) >= MAX_CLIENTS:
+            return None
+        clients[key] = time.time()
+        client_unreachable.pop(key, None)
+        last_registered_for_ip[ip] = key
+        if bundle_window:
+            client_bundle_window[key] = bundle_window
+        else:
+            client_bundle_window.pop(key, None)
+        rebuild_routing_table()
+    return key
+
+
+def get_registered_client_for_request(client_address):
+    """
+    Given a client_address (ip, src_port) from python-osc,
+    find the registered (ip, recv_port) we should use to
+    talk back to this IP.
+
+    We use the last registered port for that IP, which is
+    exactly what /register set up. Returns None if this IP
+    has not registered. A request renews the client's lease.
+    """
+    ip, _src_port = client_address
+    with state_lock:
+        key = last_registered_for_ip.get(ip)
+        if key is None or key not in clients:
+            return None
+        clients[key] = time.time()
+        client_unreachable.pop(key, None)
+    return key
+
+
+def parse_fields(tokens):
+    """
+    Turn /connect field arguments (names from POD_FIELDS, or integer
+    indices) into a tuple of indices. Returns (fields, bad_tokens);
+    fields is None when no fields were given (= all values).
+    """
+    fields = []
+    bad = []
+    for tok in tokens:
+        if isinstance(tok, int) and 0 <= tok < len(POD_FIELDS):
+            idx = tok
+        elif isinstance(tok, str) and tok.lower() in POD_FIELDS:
+            idx = POD_FIELDS.index(tok.lower())
+        else:
+            bad.append(tok)
+            continue
+        if idx not in fields:
+            fields.append(idx)
+    if not fields or fields == list(range(len(POD_FIELDS))):
+        return None, bad
+    return tuple(fields), bad
+
+
+def compile_projection(fields):
+    """
+    Build the per-message field selector once, at subscribe time.
+    A single field yields a scalar, which encodes as a one-value message.
+    """
+    if fields is None:
+        return None
+    return itemgetter(*fields)
+
+
+def parse_connect_options(tokens):
+    """
+    Split the /connect arguments after pod_name into a Subscription.
+    Recognised: field names/indices, "rate", hz, a decimation mode
+    ("latest" or "avg") and "multicast". Returns (Subscription,
+    bad_tokens).
+    """
+    field_tokens = []
+    bad = []
+    rate = None
+    mode = "latest"
+    multicast = False
+    tokens = list(tokens)
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        word = tok.lower() if isinstance(tok, str) else None
+        if word == "rate" and i + 1 < len(tokens):
+            try:
+                rate = float(tokens[i + 1])
+            except (TypeError, ValueError):
+                bad.append(tokens[i + 1])
+            i += 2
+            continue
+        if word in DECIMATION_MODES:
+            mode = word
+        elif word == "multicast":
+            multicast = True
+        else:
+            field_tokens.append(tok)
+        i += 1
+
+    fields, bad_fields = parse_fields(field_tokens)
+    if rate is not None and rate <= 0:
+        rate = None
+    return Subscription(fields, rate, mode, multicast), bad + bad_fields
+
+
+def is_pod_pattern(name):
+    return any(c in name for c in "*?[]{}")
+
+
+def compile_pod_pattern(pattern):
+    """
+    Compile an OSC address pattern (* ? [a-z] [!a-z] {a,b}) into a
+    match function. Raises ValueError if the pattern is malformed.
+    """
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end < 0:
+                raise ValueError(f"unclosed '[' in {pattern}")
+            body = pattern[i + 1:end]
+            negate = body.startswith("!")
+            if negate:
+                body = body[1:]
+            if not body:
+                raise ValueError(f"empty '[]' in {pattern}")
+            body = "".join("\\" + ch if ch in "\\^]" else ch for ch in body)
+            out.append(f"[{'^' if negate else ''}{body}]")
+            i = end
+        elif c == "{":
+            end = pattern.find("}", i + 1)
+            if end < 0:
+                raise ValueError(f"unclosed '{{' in {pattern}")
+            choices = pattern[i + 1:end].split(",")
+            out.append("(?:" + "|".join(re.escape(ch) for ch in choices) + ")")
+            i = end
+        elif c in "]}":
+            raise ValueError(f"unmatched '{c}' in {pattern}")
+        else:
+            out.append(re.escape(c))
+        i += 1
+    try:
+        return re.compile("".join(out)).fullmatch
+    except re.error as e:
+        raise ValueError(f"bad pattern {pattern}: {e}")
+
+
+def resolve_pod_patterns(pod_name):
+    """
+    Point pattern_routes[pod_name] at every client whose /connect
+    patterns match pod_name (the last matching pattern connected wins),
+    unless the client excluded the pod. Returns True if anything
+    changed. Caller must hold state_lock.
+    """
+    resolved = {}
+    for key, patterns in client_patterns.items():
+        if pod_name in pattern_exclusions.get(key, ()):
+            continue
+        for match, sub in reversed(patterns.values()):
+            if match(pod_name):
+                resolved[key] = sub
+                break
+    if resolved == pattern_routes.get(pod_name, {}):
+        return False
+    if resolved:
+        pattern_routes[pod_name] = resolved
+    else:
+        pattern_routes.pop(pod_name, None)
+    return True
+
+
+def resolve_all_pod_patterns():
+    """
+    Re-resolve patterns against every pod seen so far, after patterns
+    were added or removed. Caller must hold state_lock.
+    """
+    changed = False
+    for pod_name in set(pod_status) | set(pattern_routes):
+        changed |= resolve_pod_patterns(pod_name)
+    return changed
+
+
+def on_new_pod(pod_name):
+    """
+    Called once when a pod is first seen: bind it to any matching
+    pattern subscriptions.
+    """
+    if not client_patterns:
+        return
+    with state_lock:
+        if not resolve_pod_patterns(pod_name):
+            return
+        if routes_from_main:
+            add_worker_pattern_routes(pod_name)
+        else:
+            rebuild_routing_table()
+
+
+def describe_subscription(pod_name, sub):
+    text = pod_name
+    if sub.fields is not None:
+        text += f"[{','.join(POD_FIELDS[i] for i in sub.fields)}]"
+    if sub.rate is not None:
+        text += f"@{sub.rate:g}Hz" + (" avg" if sub.mode == "avg" else "")
+    if sub.multicast:
+        text += " multicast"
+    return text
+
+
+class Decimator:
+    """
+    Rate limiter for one Route, driven by the samples themselves (no
+    timers): offer() is called for every sample and returns the values
+    to forward when the next send is due, else None. Sends are kept on
+    a fixed grid of 1/rate seconds so the long-run rate matches.
+    """
+
+    __slots__ = ("period", "average", "next_due", "sums", "count")
+
+    def __init__(self, rate, mode):
+        self.period = 1.0 / rate
+        self.average = (mode == "avg")
+        self.next_due = 0.0
+        self.sums = None
+        self.count = 0
+
+    def offer(self, now, data):
+        if self.average:
+            values = data if isinstance(data, (list, tuple)) else (data,)
+            try:
+                if self.sums is None:
+                    self.sums = [float(v) for v in values]
+                else:
+                    self.sums = [a + v for a, v in zip(self.sums, values)]
+                self.count += 1
+            except (TypeError, ValueError):
+                pass  # non-numeric sample: fall back to latest value
+
+        if now < self.next_due:
+            return None
+
+        self.next_due += self.period
+        if self.next_due <= now:
+            self.next_due = now + self.period
+
+        if self.average and self.count:
+            data = [v / self.count for v in self.sums]
+            self.sums = None
+            self.count = 0
+        return data
+
+
+def rebuild_routing_table(announce=()):
+    """
+    Recompute the pod -> destinations snapshot from pod_subscriptions
+    and the resolved pattern_routes, and publish it. Caller must hold
+    state_lock. Clients that joined a multicast stream are told its
+    group and port, as are the (key, pod_name) pairs in announce that
+    listen to one (a /connect asking for it again).
+    """
+    global routing_table, client_view, replicated_patterns
+
+    # Keep decimator state for groups that survive the rebuild
+    old_decimators = route_decimators(routing_table)
+    old_listeners = {
+        (pod_name, route.sub): route.listeners
+        for pod_name, routes in routing_table.items()
+        for route in routes
+        if route.listeners
+    }
+    streams = set()
+    joined = []
+
+    table = {}
+    for pod_name in set(pod_subscriptions) | set(pattern_routes):
+        subs = dict(pattern_routes.get(pod_name, {}))
+        for key in pod_subscriptions.get(pod_name, ()):
+            subs[key] = client_subscriptions[key].get(pod_name, FULL_SUBSCRIPTION)
+        groups = defaultdict(list)
+        for key, sub in subs.items():
+            if key in clients:
+                groups[sub].append(key)
+        routes = []
+        for sub, keys_for_sub in groups.items():
+            decimator = None
+            if sub.rate is not None:
+                decimator = (old_decimators.get((pod_name, sub))
+                             or Decimator(sub.rate, sub.mode))
+            port = multicast_port(pod_name, sub) if sub.multicast else None
+            if port is not None:
+                streams.add((pod_name, sub))
+                listeners = tuple(sorted(keys_for_sub))
+                old = old_listeners.get((pod_name, sub), ())
+                joined += [(key, pod_name, port) for key in listeners
+                           if key not in old or (key, pod_name) in announce]
+                routes.append(Route(sub, compile_projection(sub.fields),
+                                    ((MULTICAST_GROUP, port),), (), decimator,
+                                    listeners, [0]))
+                continue
+            routes.append(unicast_route(sub, keys_for_sub, decimator))
+        if routes:
+            table[pod_name] = tuple(routes)
+    for stream in set(multicast_ports).difference(streams):
+        del multicast_ports[stream]
+    # Swap before folding, so a concurrent client_sent_totals() can only
+    # undercount for a moment, never count twice
+    old_table = routing_table
+    routing_table = table
+    settle_client_sent(old_table, clients)
+    client_view = {
+        "clients": {key: tuple(sorted(
+                        describe_subscription(pod, sub)
+                        for pod, sub in (*client_subscriptions.get(key, {}).items(),
+                                         *((pattern, sub) for pattern, (_match, sub)
+                                           in client_patterns.get(key, {}).items()))))
+                    for key in clients},
+        "bundle_window": dict(client_bundle_window),
+        "last_registered": dict(last_registered_for_ip),
+    }
+    patterns = pattern_snapshot() if worker_route_conns else None
+    for conn in worker_route_conns:
+        try:
+            if patterns != replicated_patterns:
+                conn.send(("patterns", patterns))
+            conn.send(routing_table)
+        except OSError:
+            pass  # worker has exited
+    replicated_patterns = patterns
+    for key, pod_name, port in joined:
+        send_to_client(key, "/broker", ["multicast", pod_name, MULTICAST_GROUP, port])
+
+
+def route_decimators(table):
+    """
+    Return {(pod_name, Subscription): Decimator} for the rate-limited
+    routes of a routing table.
+    """
+    return {
+        (pod_name, route.sub): route.decimator
+        for pod_name, routes in table.items()
+        for route in routes
+        if route.decimator is not None
+    }
+
+
+def carry_decimators(table, old_table):
+    """
+    Worker side: return the routing table replicated from the main
+    process with the decimators of old_table's routes for the same pod
+    and Subscription, so a control-plane change doesn't restart their
+    rate limiting (the main process's copies have never run here).
+    """
+    old_decimators = route_decimators(old_table)
+    if not old_decimators:
+        return table
+    return {
+        pod_name: tuple(
+            route._replace(decimator=old_decimators.get((pod_name, route.sub),
+                                                        route.decimator))
+            if route.decimator is not None else route
+            for route in routes)
+        for pod_name, routes in table.items()
+    }
+
+
+def unicast_route(sub, keys, decimator):
+    """
+    Route of `sub` to the clients `keys`, direct or bundled per their
+    /register.
+    """
+    dests = tuple(sorted(k for k in keys if k not in client_bundle_window))
+    batched = tuple(sorted((k, client_bundle_window[k])
+                           for k in keys if k in client_bundle_window))
+    return Route(sub, compile_projection(sub.fields),
+                 dests, batched, decimator, (), [0])
+
+
+def pattern_snapshot():
+    """
+    What a worker needs to resolve patterns itself: ({key: ((pattern,
+    Subscription), ...)}, {key: excluded pods}, the registered client
+    keys, client_bundle_window). Caller must hold state_lock.
+    """
+    return ({key: tuple((pattern, sub) for pattern, (_match, sub) in patterns.items())
+             for key, patterns in client_patterns.items() if patterns},
+            {key: frozenset(pods) for key, pods in pattern_exclusions.items() if pods},
+            frozenset(clients),
+            dict(client_bundle_window))
+
+
+def apply_pattern_snapshot(snapshot):
+    """
+    Worker side of pattern_snapshot(): take over the main process's
+    pattern subscriptions and the clients they may route to.
+    """
+    patterns, exclusions, keys, windows = snapshot
+    now = time.time()
+    with state_lock:
+        client_patterns.clear()
+        for key, items in patterns.items():
+            client_patterns[key] = {pattern: (compile_pod_pattern(pattern), sub)
+                                    for pattern, sub in items}
+        pattern_exclusions.clear()
+        pattern_exclusions.update((key, set(pods)) for key, pods in exclusions.items())
+        clients.clear()
+        clients.update(dict.fromkeys(keys, now))
+        client_bundle_window.clear()
+        client_bundle_window.update(windows)
+
+
+def add_worker_pattern_routes(pod_name):
+    """
+    Worker side of on_new_pod(): add routes for the pattern subscribers
+    of a pod this worker saw first, until the main process hears of the
+    pod (WORKER_STATUS_INTERVAL) and sends a table with them. Multicast
+    subscriptions wait for the main process, which allocates the port
+    and tells the listeners. Caller must hold state_lock.
+    """
+    global routing_table
+    routes = routing_table.get(pod_name, ())
+    subs = {key: sub for key, sub in pattern_routes.get(pod_name, {}).items()
+            if key in clients and not sub.multicast}
+    for route in routes:  # the main process's routes win
+        for key in (*route.dests, *(k for k, _w in route.batched), *route.listeners):
+            subs.pop(key, None)
+    groups = defaultdict(list)
+    for key, sub in subs.items():
+        groups[sub].append(key)
+    if not groups:
+        return
+    routes += tuple(unicast_route(sub, keys, Decimator(sub.rate, sub.mode)
+                                  if sub.rate is not None else None)
+                    for sub, keys in groups.items())
+    routing_table = {**routing_table, pod_name: routes}
+
+
+def settle_client_sent(table, known=None):
+    """
+    Add the messages sent by each route of `table`, which is being
+    replaced, to client_sent for its destinations (only those in
+    `known`, or multicast groups, if given).
+    """
+    for routes in table.values():
+        for route in routes:
+            count = route.sent[0] if route.sent else 0
+            if not count:
+                continue
+            keys = list(route.dests) + [key for key, _window in route.batched]
+            for key in keys:
+                if known is None or key in known or key[0] == MULTICAST_GROUP:
+                    client_sent[key] += count
+
+
+def client_sent_totals():
+    """
+    Return {(ip, port): messages sent}, including the current routing
+    table's counts not yet folded into client_sent.
+    """
+    totals = defaultdict(int, client_sent)
+    for routes in routing_table.values():
+        for route in routes:
+            count = route.sent[0] if route.sent else 0
+            if count:
+                for key in route.dests:
+                    totals[key] += count
+                for key, _window in route.batched:
+                    totals[key] += count
+    return totals
+
+
+def multicast_port(pod_name, sub):
+    """
+    Return the UDP port of the multicast stream for pod_name with these
+    options, allocating the lowest free one; None if multicast is off
+    or the ports have run out (the stream then goes unicast). Caller
+    must hold state_lock.
+    """
+    if MULTICAST_GROUP is None:
+        return None
+    port = multicast_ports.get((pod_name, sub))
+    if port is None:
+        used = set(multicast_ports.values())
+        port = MULTICAST_PORT
+        while port in used:
+            port += 1
+        if port > 65535:
+            return None
+        multicast_ports[(pod_name, sub)] = port
+    return port
+
+
+def broadcast_to_pod_clients(pod_name, sensor_data, raw=None):
+    """
+    Send sensor_data to all clients subscribed to pod_name and return
+    the number of destinations.
+
+    Destinations come from the routing_table snapshot, so no lock is
+    taken. Each Route applies its precompiled field projection and, if
+    rate-limited, its decimator; the resulting OSC message is encoded
+    once and the same bytes are sent to every destination in it over
+    the shared egress socket, without blocking. A destination whose
+    send would block, or that already has a backlog, gets the message
+    through its send queue instead (see OUTBOUND QUEUES).
+
+    raw, if given, is the pod's original datagram. Routes that take
+    every value at full rate forward it unchanged (passthrough: no
+    decoding, full precision), and sensor_data may then be None: it is
+    decoded from raw only if another route needs the values.
+
+    With --profile, the time spent sending (sendto() calls, queueing,
+    coalescing) is recorded as the "send" stage and the rest as
+    "route".
+    """
+    routes = routing_table.get(pod_name)
+    if not routes:
+        return 0
+
+    stages = profile_stages
+    if stages is not None:
+        t_start = time.perf_counter_ns()
+        send_ns = 0
+    sendto = egress_sock.sendto
+    dontwait = socket.MSG_DONTWAIT
+    backlogged = send_queues
+    sent = 0
+    now = None
+    for route in routes:
+        if raw is not None and route.project is None and route.decimator is None:
+            dgram = raw
+        else:
+            if sensor_data is None:
+                sensor_data = decode_osc_values(raw)
+                if sensor_data is None:
+                    return sent  # malformed arguments
+            if route.project is None:
+                data = sensor_data
+            else:
+                try:
+                    data = route.project(sensor_data)
+                except IndexError:
+                    continue  # pod sent fewer values than selected
+            if route.decimator is not None:
+                if now is None:
+                    now = time.monotonic()
+                data = route.decimator.offer(now, data)
+                if data is None:
+                    continue  # not due yet
+            dgram = encode_osc_message(pod_name, data)
+            if dgram is None:
+                continue  # values python-osc can't encode back
+        route.sent[0] += 1
+        if stages is not None:
+            t_send = time.perf_counter_ns()
+        if backlogged:
+            for key in route.dests:
+                if key in backlogged:
+                    queue_send(key, pod_name, dgram)
+                    continue
+                try:
+                    sendto(dgram, dontwait, key)
+                except (OSError, OverflowError) as e:
+                    send_failed(key, pod_name, dgram, e)
+        else:
+            # No client has a backlog (the usual case): skip the lookups
+            for key in route.dests:
+                try:
+                    sendto(dgram, dontwait, key)
+                except (OSError, OverflowError) as e:
+                    send_failed(key, pod_name, dgram, e)
+        if route.batched:
+            if now is None:
+                now = time.monotonic()
+            for key, window in route.batched:
+                coalesce(key, window, dgram, now)
+        if stages is not None:
+            send_ns += time.perf_counter_ns() - t_send
+        sent += len(route.dests) + len(route.batched)
+    if stages is not None:
+        stages.send.record(send_ns)
+        stages.route.record(time.perf_counter_ns() - t_start - send_ns)
+    return sent
+
+
+# ---------------------------------------------------------
+#  OUTBOUND COALESCING (per-client OSC bundles)
+#  Messages for a client in bundle mode are held for its
+#  window and then sent as one OSC bundle. One flusher
+#  serves all clients: a thread (thread engine / workers)
+#  or loop.call_at() callbacks (asyncio engine), woken via
+#  coalesce_wake() when a client's window opens.
+# ---------------------------------------------------------
+
+# (ip, port) -> [deadline (monotonic), [dgrams], size in bytes]
+coalesce_pending = {}
+coalesce_lock = new_timed_lock("coalesce")
+coalesce_event = threading.Event()
+
+
+def _wake_flusher_thread(deadline):
+    coalesce_event.set()
+
+
+# Set by the engine that runs the flusher
+coalesce_wake = _wake_flusher_thread
+
+
+def send_bundle(key, dgrams):
+    data = dgrams[0] if len(dgrams) == 1 else encode_osc_bundle(dgrams)
+    send_datagram(key, None, data)
+
+
+def coalesce(key, window, dgram, now):
+    """
+    Queue an encoded message for a bundle-mode client. Opens a new
+    window if none is pending, and sends early if the bundle would
+    outgrow one frame.
+    """
+    full = None
+    with coalesce_lock:
+        entry = coalesce_pending.get(key)
+        if entry is None:
+            coalesce_pending[key] = [now + window, [dgram], len(dgram) + 20]
+        else:
+            entry[1].append(dgram)
+            entry[2] += len(dgram) + 4
+            if entry[2] >= COALESCE_MAX_BYTES:
+                full = coalesce_pending.pop(key)[1]
+    if entry is None:
+        coalesce_wake(now + window)
+    elif full is not None:
+        send_bundle(key, full)
+
+
+def flush_due_bundles():
+    """
+    Send every bundle whose window has closed. Returns the earliest
+    deadline still pending, or None.
+    """
+    now = time.monotonic()
+    due = []
+    next_deadline = None
+    with coalesce_lock:
+        for key, entry in list(coalesce_pending.items()):
+            if entry[0] <= now:
+                due.append((key, entry[1]))
+                del coalesce_pending[key]
+            elif next_deadline is None or entry[0] < next_deadline:
+                next_deadline = entry[0]
+    for key, dgrams in due:
+        send_bundle(key, dgrams)
+    return next_deadline
+
+
+def coalesce_flush_loop():
+    """
+    Flusher thread: sleep until the earliest pending window closes (or
+    a new one opens), then send what is due.
+    """
+    while True:
+        next_deadline = flush_due_bundles()
+        timeout = None
+        if next_deadline is not None:
+            timeout = max(0.0, next_deadline - time.monotonic())
+        coalesce_event.wait(timeout)
+        coalesce_event.clear()
+
+
+def start_coalesce_flusher():
+    threading.Thread(target=coalesce_flush_loop, daemon=True).start()
+
+
+# ---------------------------------------------------------
+#  OUTBOUND QUEUES (per-client backpressure)
+#  Pod data goes straight out of the shared egress socket
+#  while it takes it. A client whose send would block gets
+#  a bounded queue, drained by its send lane: one of a few
+#  senders, each with its own socket, so datagrams stuck in
+#  the kernel for one client (e.g. a host that left the
+#  network, pending ARP) fill only that lane's send buffer.
+#  Lanes are threads (thread engine / workers) or writer
+#  callbacks (asyncio engine), woken via send_wake(). A full
+#  queue drops by SEND_POLICY: "drop-oldest", or "latest"
+#  (at most one waiting message per pod, the newest).
+# ---------------------------------------------------------
+
+class SendLane:
+    """
+    One sender: its socket and the FIFO of clients it has to drain.
+    """
+
+    __slots__ = ("sock", "ready", "wake")
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.ready = deque()
+        self.wake = threading.Condition(send_lock)
+
+
+# (ip, port) -> deque of (pod name or None, dgram) waiting. A client
+# has an entry exactly while it is on its lane's ready FIFO or being
+# sent by its lane; its pod data is queued until then, to keep order.
+send_queues = {}
+send_lock = new_timed_lock("send")
+send_lanes = []
+
+# (ip, port) -> messages of pod data sent (for /metrics), datagrams
+# dropped from a full queue, failed sends. A multicast stream counts
+# as its (group, port).
+client_sent = defaultdict(int)
+send_drops = defaultdict(int)
+send_errors = defaultdict(int)
+
+
+def _wake_sender_thread(lane):
+    lane.wake.notify()
+
+
+# Set by the engine that runs the lanes; called with send_lock held
+send_wake = _wake_sender_thread
+
+
+def open_send_lanes(count):
+    for _ in range(max(1, count)):
+        send_lanes.append(SendLane())
+
+
+def egress_sockets():
+    return [egress_sock] + [lane.sock for lane in send_lanes]
+
+
+def configure_multicast_egress():
+    """
+    Set the multicast TTL and interface on every egress socket, once
+    the send lanes are open (per process).
+    """
+    for sock in egress_sockets():
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
+        if MULTICAST_INTERFACE:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                            socket.inet_aton(MULTICAST_INTERFACE))
+
+
+def send_failed(key, tag, dgram, error):
+    """
+    Handle an error from a non-blocking send on the shared egress
+    socket (see retry_send()): queue the datagram if the socket was full, else
+    count the error against the client.
+    """
+    error = retry_send(dgram, key, error)
+    if error is None:
+        return
+    if isinstance(error, BlockingIOError):
+        queue_send(key, tag, dgram)
+    else:
+        count_send_error(key, error)
+
+
+def count_send_error(key, error):
+    send_errors[key] += 1
+    if send_errors[key] == 1:
+        print(f"Error sending to client {key[0]}:{key[1]}: {error} "
+              f"(further errors are only counted)", file=sys.stderr)
+
+
+def send_datagram(key, tag, dgram):
+    """
+    Send a datagram to one client without blocking, through its send
+    queue if it has a backlog. tag is the pod name for pod data, or
+    None for a datagram that must not be replaced (a bundle or reply).
+    """
+    if key in send_queues:
+        queue_send(key, tag, dgram)
+        return
+    try:
+        egress_sock.sendto(dgram, socket.MSG_DONTWAIT, key)
+    except (OSError, OverflowError) as e:
+        send_failed(key, tag, dgram, e)
+
+
+def queue_send(key, tag, dgram):
+    """
+    Append a datagram to the client's send queue, dropping per
+    SEND_POLICY if it is full, and hand a new backlog to its lane.
+    """
+    with send_lock:
+        queue = send_queues.get(key)
+        if queue is None:
+            if not send_lanes:
+                send_drops[key] += 1
+                return
+            queue = send_queues[key] = deque()
+            lane = send_lanes[hash(key) % len(send_lanes)]
+            lane.ready.append(key)
+            send_wake(lane)
+        elif tag is not None and SEND_POLICY == "latest":
+            for i, (waiting, _dgram) in enumerate(queue):
+                if waiting == tag:
+                    del queue[i]
+                    send_drops[key] += 1
+                    break
+        if len(queue) >= SEND_QUEUE_DEPTH:
+            queue.popleft()
+            send_drops[key] += 1
+        queue.append((tag, dgram))
+
+
+def sender_loop(lane):
+    """
+    Lane thread: take everything queued for the next ready client and
+    send it with blocking sends on the lane's socket; a client that
+    queued more meanwhile goes to the back of the FIFO.
+    """
+    sock = lane.sock
+    while True:
+        with send_lock:
+            while not lane.ready:
+                lane.wake.wait()
+            key = lane.ready.popleft()
+            queue = send_queues[key]
+            batch = list(queue)
+            queue.clear()
+        for _tag, dgram in batch:
+            try:
+                sock.sendto(dgram, key)
+            except (OSError, OverflowError) as e:
+                error = retry_send(dgram, key, e, sock)
+                if error is not None:
+                    count_send_error(key, error)
+        with send_lock:
+            if queue:
+                lane.ready.append(key)
+            else:
+                del send_queues[key]
+
+
+def drain_send_lane(lane):
+    """
+    asyncio engine: send queued datagrams on the lane's socket, one per
+    ready client in turn, until the socket would block. Returns True
+    once the lane has nothing left.
+    """
+    sock = lane.sock
+    ready = lane.ready
+    with send_lock:
+        while ready:
+            key = ready[0]
+            queue = send_queues[key]
+            if queue:
+                dgram = queue[0][1]
+                try:
+                    sock.sendto(dgram, socket.MSG_DONTWAIT, key)
+                except BlockingIOError:
+                    return False
+                except (OSError, OverflowError) as e:
+                    error = retry_send(dgram, key, e, sock)
+                    if isinstance(error, BlockingIOError):
+                        return False
+                    if error is not None:
+                        count_send_error(key, error)
+                queue.popleft()
+            if queue:
+                ready.rotate(-1)
+            else:
+                ready.popleft()
+                del send_queues[key]
+    return True
+
+
+def start_sender_threads():
+    for lane in send_lanes:
+        threading.Thread(target=sender_loop, args=(lane,), daemon=True).start()
+
+
+def get_active_pods():
+    """
+    Return a sorted list of "active" pods from the pod directory.
+
+    A pod is considered active if:
+      - it has sent data within POD_ACTIVE_TIMEOUT seconds, OR
+      - it has at least one subscribed client.
+
+    The list is cached until a pod comes up or goes down or the
+    subscriptions change; callers must not modify it.
+    """
+    global active_pods_cache
+    version, routes, pods = active_pods_cache
+    if version != directory_version or routes is not routing_table:
+        routes = routing_table
+        version = directory_version
+        # Pods with subscribers count even if no data yet
+        pods = sorted(live_pods.union(routes))
+        active_pods_cache = (version, routes, pods)
+    return pods
+
+
+# ---------------------------------------------------------
+#  POD DIRECTORY (pod_up / pod_down pushes)
+#  The ingest path marks a pod live when it sends after
+#  being down (a set lookup per packet); the liveness loop
+#  pops expired deadlines from liveness_heap, re-queues the
+#  pods that sent since, and announces the rest as down.
+# ---------------------------------------------------------
+
+def announce_pod_event(event, pod_name):
+    """
+    Send /broker, event, pod_name to every registered client.
+    """
+    for key in client_view["clients"]:
+        send_to_client(key, "/broker", [event, pod_name])
+
+
+def mark_pod_up(pod_name, now):
+    """
+    Called when a pod not in live_pods sends: add it, queue its
+    deadline and announce "pod_up".
+    """
+    global directory_version
+    with directory_lock:
+        if pod_name in live_pods:
+            return
+        live_pods.add(pod_name)
+        directory_version += 1
+        heapq.heappush(liveness_heap, (now + POD_ACTIVE_TIMEOUT, pod_name))
+    announce_pod_event("pod_up", pod_name)
+
+
+def expire_live_pods(now):
+    """
+    Process the liveness deadlines that have passed: pods that sent
+    since are re-queued at last_seen + POD_ACTIVE_TIMEOUT, the others
+    leave live_pods and are announced with "pod_down". Returns the next
+    deadline, or None if no pod is live.
+    """
+    global directory_version
+    down = []
+    with directory_lock:
+        while liveness_heap and liveness_heap[0][0] <= now:
+            _deadline, pod_name = heapq.heappop(liveness_heap)
+            state = pod_status.get(pod_name)
+            if state is not None and state.last_seen + POD_ACTIVE_TIMEOUT > now:
+                heapq.heappush(liveness_heap,
+                               (state.last_seen + POD_ACTIVE_TIMEOUT, pod_name))
+            else:
+                live_pods.discard(pod_name)
+                down.append(pod_name)
+                directory_version += 1
+        next_deadline = liveness_heap[0][0] if liveness_heap else None
+    for pod_name in down:
+        announce_pod_event("pod_down", pod_name)
+    return next_deadline
+
+
+# ---------------------------------------------------------
+#  LIVENESS (client leases, unreachable clients, idle pods)
+#  A janitor pass every LIVENESS_INTERVAL expires client
+#  leases and idle pods. On Linux, ICMP errors for clients
+#  are read from the egress socket's error queue as they
+#  arrive, and a client whose port stays unreachable is
+#  evicted even without --client-timeout.
+# ---------------------------------------------------------
+
+def enable_egress_errors():
+    """
+    Queue ICMP errors for datagrams sent on the egress sockets (shared
+    and send lanes) with IP_RECVERR, and return those sockets: none
+    where that isn't available (non-Linux).
+    """
+    if not sys.platform.startswith("linux"):
+        return []
+    socks = egress_sockets()
+    try:
+        for sock in socks:
+            sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+    except OSError:
+        return []
+    return socks
+
+
+def drain_egress_errors(sock):
+    """
+    Read every error queued on an egress socket and return the
+    (ip, port) destinations reported unreachable.
+    """
+    unreachable = []
+    while True:
+        try:
+            _data, ancdata, _flags, addr = sock.recvmsg(
+                0, 512, MSG_ERRQUEUE | socket.MSG_DONTWAIT)
+        except OSError:
+            break
+        for level, kind, cmsg in ancdata:
+            if level == socket.IPPROTO_IP and kind == IP_RECVERR and len(cmsg) >= 4:
+                # struct sock_extended_err starts with u32 ee_errno
+                (ee_errno,) = struct.unpack_from("=I", cmsg)
+                if ee_errno in UNREACHABLE_ERRNOS and addr:
+                    unreachable.append(addr[:2])
+    # Nobody should send to the egress port, but stray datagrams would
+    # keep the socket readable
+    while True:
+        try:
+            sock.recv(65535, socket.MSG_DONTWAIT)
+        except OSError:
+            break
+    return unreachable
+
+
+def egress_error_loop(report, socks):
+    """
+    Thread: wait for errors on the egress sockets and pass the
+    unreachable destinations to report().
+    """
+    while True:
+        readable, _, _ = select.select(socks, [], [])
+        unreachable = [key for sock in readable for key in drain_egress_errors(sock)]
+        if unreachable:
+            report(unreachable)
+
+
+def evict_client(key):
+    """
+    Forget the client at key: lease, subscriptions, patterns, send
+    counters and any pending bundle or queued data. If it was its IP's
+    last /register, the IP falls back to its most recently heard-from
+    remaining client. Caller must hold state_lock and rebuild the
+    routing table afterwards.
+    """
+    clients.pop(key, None)
+    client_unreachable.pop(key, None)
+    client_bundle_window.pop(key, None)
+    ip = key[0]
+    if last_registered_for_ip.get(ip) == key:
+        others = [k for k in clients if k[0] == ip]
+        if others:
+            last_registered_for_ip[ip] = max(others, key=clients.get)
+        else:
+            del last_registered_for_ip[ip]
+    for pod_name in client_subscriptions.pop(key, {}):
+        subscribers = pod_subscriptions.get(pod_name)
+        if subscribers is not None:
+            subscribers.discard(key)
+            if not subscribers:
+                del pod_subscriptions[pod_name]
+    pattern_exclusions.pop(key, None)
+    if client_patterns.pop(key, None):
+        for pod_name in list(pattern_routes):
+            routes = pattern_routes[pod_name]
+            routes.pop(key, None)
+            if not routes:
+                del pattern_routes[pod_name]
+    with coalesce_lock:
+        coalesce_pending.pop(key, None)
+    client_sent.pop(key, None)
+    send_drops.pop(key, None)
+    send_errors.pop(key, None)
+    with send_lock:
+        queue = send_queues.get(key)
+        if queue:
+            queue.clear()  # its lane removes the entry
+
+
+def handle_unreachable(keys, now=None):
+    """
+    Record ICMP errors for the given client keys, and evict clients
+    that have been unreachable for CLIENT_UNREACHABLE_SECONDS. Errors
+    more than twice that apart start a new streak.
+    """
+    if now is None:
+        now = time.time()
+    evicted = []
+    with state_lock:
+        for key in set(keys):
+            if key not in clients:
+                continue
+            streak = client_unreachable.get(key)
+            if streak is None or now - streak[1] > 2 * CLIENT_UNREACHABLE_SECONDS:
+                client_unreachable[key] = [now, now]
+                continue
+            streak[1] = now
+            if now - streak[0] >= CLIENT_UNREACHABLE_SECONDS:
+                evict_client(key)
+                evicted.append(key)
+        if evicted:
+            rebuild_routing_table()
+    for key in evicted:
+        print(f"Evicted client {key[0]}:{key[1]} (port unreachable)")
+
+
+def expire_clients(now):
+    """
+    Evict clients not heard from for CLIENT_TIMEOUT seconds, telling
+    each one with /broker, "evicted", "timeout".
+    """
+    with state_lock:
+        expired = [key for key, seen in clients.items()
+                   if now - seen > CLIENT_TIMEOUT]
+        for key in expired:
+            evict_client(key)
+        if expired:
+            rebuild_routing_table()
+    for key in expired:
+        send_to_client(key, "/broker", ["evicted", "timeout"])
+        print(f"Evicted client {key[0]}:{key[1]} (no heartbeat for {CLIENT_TIMEOUT:g} s)")
+
+
+def expire_pods(now, timeout):
+    """
+    Forget pods silent for more than `timeout` seconds: status, history,
+    latency and resolved pattern subscriptions (re-resolved if the pod
+    comes back). Literal /connect subscriptions are kept. Returns the
+    names removed.
+    """
+    stale = [name for name, state in list(pod_status.items())
+             if now - state.last_seen > timeout]
+    for name in stale:
+        pod_status.pop(name, None)
+    if stale and pattern_routes:
+        with state_lock:
+            if ([pattern_routes.pop(name) for name in stale if name in pattern_routes]
+                    and not routes_from_main):
+                rebuild_routing_table()
+    return stale
+
+
+def run_janitor(now=None):
+    """
+    One liveness pass: expire client leases and idle pods.
+    """
+    if now is None:
+        now = time.time()
+    if CLIENT_TIMEOUT > 0:
+        expire_clients(now)
+    if POD_TIMEOUT > 0:
+        for name in expire_pods(now, POD_TIMEOUT):
+            print(f"Forgot pod {name} (silent for {POD_TIMEOUT:g} s)")
+
+
+def liveness_step(next_pass, interval):
+    """
+    Expire pod liveness deadlines, and run the janitor if next_pass has
+    come. Returns (next janitor pass, seconds to sleep until the next
+    deadline or pass).
+    """
+    now = time.time()
+    if now >= next_pass:
+        run_janitor(now)
+        next_pass = now + interval
+    wake = expire_live_pods(now)
+    if wake is None or wake > next_pass:
+        wake = next_pass
+    return next_pass, max(0.0, wake - time.time())
+
+
+def liveness_loop(interval=LIVENESS_INTERVAL):
+    next_pass = time.time() + interval
+    while True:
+        next_pass, delay = liveness_step(next_pass, interval)
+        time.sleep(delay)
+
+
+def start_liveness_threads():
+    """
+    Thread engine: the liveness loop, and the ICMP error reader if the
+    OS supports it.
+    """
+    threading.Thread(target=liveness_loop, daemon=True).start()
+    socks = enable_egress_errors()
+    if socks:
+        threading.Thread(target=egress_error_loop,
+                         args=(handle_unreachable, socks), daemon=True).start()
+
+
+def warn_ingest_error(data, error):
+    global ingest_error_warned
+    if not ingest_error_warned:
+        ingest_error_warned = True
+        print(f"Dropping ESP32 datagram {data[:64]!r} ({error!r}); later "
+              f"failures are dropped silently.", file=sys.stderr)
+
+
+def warn_pod_limit(pod_name):
+    global pod_limit_warned
+    if not pod_limit_warned:
+        pod_limit_warned = True
+        print(f"Tracking MAX_PODS={MAX_PODS} pods; ignoring new addresses "
+              f"such as {pod_name} until idle pods are forgotten.", file=sys.stderr)
+
+
+# ---------------------------------------------------------
+#  POD HISTORY (ring buffers + /history replies)
+# ---------------------------------------------------------
+
+class PodHistory:
+    """
+    Fixed-size ring buffer of (timestamp, values) samples for one pod,
+    backed by preallocated NumPy arrays. Missing or non-numeric values
+    are stored as NaN.
+
+    On the passthrough path a sample is the pod's raw datagram, copied
+    into a fixed slot of a bytearray (raw_len[i] > 0 marks slot i as
+    raw) and decoded only when window() reads it, so keeping history
+    costs the data path no decoding.
+    """
+
+    def __init__(self, capacity, width=HISTORY_WIDTH):
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, width), np.nan, dtype=np.float64)
+        self.raw = bytearray(capacity * HISTORY_RAW_BYTES)
+        self.raw_len = array.array("H", bytes(2 * capacity))
+        self.capacity = capacity
+        self.width = width
+        self.next = 0      # slot the next sample goes into
+        self.filled = 0    # number of valid slots
+
+    def fill_row(self, row, data):
+        try:
+            if len(data) == self.width:
+                row[:] = data
+            else:
+                row[:] = np.nan
+                n = min(len(data), self.width)
+                row[:n] = data[:n]
+        except (TypeError, ValueError):
+            row[:] = np.nan
+            for j, v in enumerate(data[:self.width]):
+                if isinstance(v, (int, float)):
+                    row[j] = v
+
+    def append(self, timestamp, data):
+        i = self.next
+        self.times[i] = timestamp
+        self.raw_len[i] = 0
+        self.fill_row(self.values[i], data)
+        self.next = (i + 1) % self.capacity
+        if self.filled < self.capacity:
+            self.filled += 1
+
+    def append_raw(self, timestamp, dgram):
+        n = len(dgram)
+        if n > HISTORY_RAW_BYTES:
+            self.append(timestamp, decode_osc_values(dgram) or ())
+            return
+        i = self.next
+        self.times[i] = timestamp
+        start = i * HISTORY_RAW_BYTES
+        self.raw[start:start + n] = dgram
+        self.raw_len[i] = n
+        self.next = (i + 1) % self.capacity
+        if self.filled < self.capacity:
+            self.filled += 1
+
+    def window(self, since):
+        """
+        Return (times, values) copies, oldest first, of the samples
+        with timestamp >= since.
+        """
+        if self.filled < self.capacity:
+            order = np.arange(self.filled)
+        else:
+            order = np.arange(self.next, self.next + self.capacity) % self.capacity
+        order = order[self.times[order] >= since]
+        values = self.values[order]
+        for row, i in enumerate(order.tolist()):
+            n = self.raw_len[i]
+            if n:
+                start = i * HISTORY_RAW_BYTES
+                self.fill_row(values[row],
+                              decode_osc_values(bytes(self.raw[start:start + n])) or ())
+        return self.times[order], values
+
+
+def history_enabled():
+    return np is not None and HISTORY_SECONDS > 0
+
+
+def new_pod_history():
+    """
+    Allocate a ring buffer sized for HISTORY_SECONDS, or return None if
+    history is disabled.
+    """
+    if not history_enabled():
+        return None
+    return PodHistory(max(1, int(HISTORY_SECONDS * HISTORY_SAMPLE_RATE)))
+
+
+def send_history(key, pod_name, seconds):
+    """
+    Stream the last `seconds` of pod_name's history to the client at
+    key as bundles of /history/podN messages, framed by /broker
+    "history" and "history_end" announcements. Returns the sample count.
+
+    Everything goes out through send_datagram(), in order with the
+    client's pod data and without blocking. A client that backs up
+    gets the rest through its send queue, and if the queue overflows
+    it loses bundles per SEND_POLICY (counted as drops). Then fewer
+    samples arrive than "history_end" reports.
+    """
+    state = pod_status.get(pod_name)
+    hist = state.history if state is not None else None
+    if hist is None:
+        times, values = (), ()
+    else:
+        times, values = hist.window(time.time() - seconds)
+        times, values = times.tolist(), values.tolist()
+    n = len(times)
+    send_to_client(key, "/broker", ["history", pod_name, n])
+
+    address = "/history" + pod_name
+    batches = [[]]
+    for t, row in zip(times, values):
+        builder = osc_message_builder.OscMessageBuilder(address=address)
+        builder.add_arg(t, "d")
+        for v in row:
+            builder.add_arg(v, "f")
+        if len(batches[-1]) == HISTORY_BUNDLE_SIZE:
+            batches.append([])
+        batches[-1].append(builder.build().dgram)
+    for batch in batches:
+        if batch:
+            send_datagram(key, None, encode_osc_bundle(batch))
+
+    send_to_client(key, "/broker", ["history_end", pod_name, n])
+    return n
+
+
+# ---------------------------------------------------------
+#  LATENCY HISTOGRAMS (fan-out time + inter-arrival jitter)
+#  Always on: recording is a few integer operations and a
+#  list increment, and memory per pod is fixed.
+# ---------------------------------------------------------
 
-# Map (ip, port) -> udp_client.SimpleUDPClient
-clients = {}
+class LatencyHistogram:
+    """
+    Fixed-memory, log-bucketed histogram of integer microsecond values
+    in the style of HdrHistogram (see the LATENCY_* constants).
+    Percentiles report the upper edge of the bucket, capped at the
+    largest value seen; sum is exact (for a Prometheus summary). Counts
+    live in an array, not a list, so the garbage collector has nothing
+    to traverse in them.
+    """
 
-# Map ip -> (ip, port) of last registered client on that IP
-last_registered_for_ip = {}
+    __slots__ = ("counts", "total", "sum", "max")
 
-# Subscriptions:
-#   pod_subscriptions[pod_name] = set of (ip, port) keys
-#   client_subscriptions[(ip, port)] = set of pod_name strings
-pod_subscriptions = defaultdict(set)
-client_subscriptions = defaultdict(set)
-
-# Map pod name -> status info:
-#   {
-#       "last_seen": float (time.time()),
-#       "last_data": list,
-#       "count": int
-#   }
-pod_status = {}
+    EMPTY_SNAPSHOT = ([0] * LATENCY_BUCKETS, 0)
+
+    def __init__(self):
+        self.counts = array.array("q", bytes(8 * LATENCY_BUCKETS))
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, us):
+        self.sum += us
+        if us < (2 << LATENCY_SUB_BITS):
+            i = us if us > 0 else 0
+        else:
+            if us >> LATENCY_MAX_BITS:
+                us = (1 << LATENCY_MAX_BITS) - 1
+            shift = us.bit_length() - LATENCY_SUB_BITS - 1
+            i = (shift << LATENCY_SUB_BITS) + (us >> shift)
+        self.counts[i] += 1
+        self.total += 1
+        if us > self.max:
+            self.max = us
+
+    @staticmethod
+    def bucket_upper(i):
+        if i < (2 << LATENCY_SUB_BITS):
+            return i
+        shift = (i >> LATENCY_SUB_BITS) - 1
+        mantissa = i - (shift << LATENCY_SUB_BITS)
+        return ((mantissa + 1) << shift) - 1
+
+    def percentile(self, q):
+        """
+        Value (us) at or below which a fraction q of the samples fall.
+        """
+        if not self.total:
+            return 0
+        rank = max(1, int(q * self.total + 0.5))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.bucket_upper(i), self.max)
+        return self.max
+
+    def snapshot(self):
+        return self.counts[:], self.sum
+
+    def delta(self, prev):
+        """
+        Return ((sparse {bucket: n} of counts added, sum added) since
+        the snapshot prev, current snapshot). A snapshot is (copy of
+        the counts, sum); EMPTY_SNAPSHOT before the first.
+        """
+        counts, total_sum = current = self.snapshot()
+        prev_counts, prev_sum = prev
+        added = {i: n - p for i, (n, p) in enumerate(zip(counts, prev_counts)) if n != p}
+        return (added, total_sum - prev_sum), current
+
+    def merge(self, delta, max_us):
+        added, added_sum = delta
+        for i, n in added.items():
+            self.counts[i] += n
+            self.total += n
+        self.sum += added_sum
+        if max_us > self.max:
+            self.max = max_us
+
+
+class PodLatency:
+    """
+    Latency histograms for one pod:
+      fanout  time from the pod message reaching the handler to the
+              last sendto() for it (only messages with subscribers)
+      jitter  change between consecutive inter-arrival gaps, as seen
+              by the broker (|gap_n - gap_n-1|)
+    """
+
+    __slots__ = ("fanout", "jitter", "last_arrival", "last_gap")
+
+    def __init__(self):
+        self.fanout = LatencyHistogram()
+        self.jitter = LatencyHistogram()
+        self.last_arrival = None
+        self.last_gap = None
+
+    def arrival(self, t_ns):
+        if self.last_arrival is not None:
+            gap = t_ns - self.last_arrival
+            if self.last_gap is not None:
+                self.jitter.record(abs(gap - self.last_gap) // 1000)
+            self.last_gap = gap
+        self.last_arrival = t_ns
+
+    def summary(self, metric):
+        """
+        (n, p50, p99, p99.9, max) in milliseconds for "fanout" or "jitter".
+        """
+        hist = getattr(self, metric)
+        return (hist.total,
+                *(hist.percentile(q) / 1000.0 for q in LATENCY_PERCENTILES),
+                hist.max / 1000.0)
+
+
+class PodState:
+    """
+    Everything the broker keeps about one pod, in a fixed-layout record
+    so the ingest path does one dict lookup and a few attribute stores
+    per message:
+      last_seen  time.time() of the last message
+      last_data  its values as received: the args tuple, or on the
+                 passthrough path the raw datagram (decoded, and
+                 rounded, only when displayed)
+      count      messages received
+      sent       messages forwarded to clients
+      history    PodHistory ring buffer, or None
+      latency    PodLatency histograms
+    """
 
-# Global lock so handlers & display thread don't race
-state_lock = threading.Lock()
+    __slots__ = ("last_seen", "last_data", "count", "sent", "history", "latency")
 
+    def __init__(self, now, history=None):
+        self.last_seen = now
+        self.last_data = ()
+        self.count = 0
+        self.sent = 0
+        self.history = history
+        self.latency = PodLatency()
 
-# ---------------------------------------------------------
-#  HELPER FUNCTIONS
-# ---------------------------------------------------------
 
-def register_client(ip: str, recv_port: int):
+def add_pod(pod_name, now, keep_history=True):
     """
-    Ensure we have a SimpleUDPClient for (ip, recv_port) and
-    record it as the "last registered" client for this IP.
+    Create the state for a pod seen for the first time and bind it to
+    matching pattern subscriptions. Returns the PodState, or None if
+    MAX_PODS pods are already tracked.
     """
-    key = (ip, recv_port)
-    with state_lock:
-        if key not in clients:
-            clients[key] = udp_client.SimpleUDPClient(ip, recv_port)
-        last_registered_for_ip[ip] = key
-    return key
+    if len(pod_status) >= MAX_PODS:
+        warn_pod_limit(pod_name)
+        return None
+    history = new_pod_history() if keep_history else None
+    state = pod_status.setdefault(pod_name, PodState(now, history))
+    on_new_pod(pod_name)
+    return state
 
 
-def get_registered_client_for_request(client_address):
+def display_values(values):
     """
-    Given a client_address (ip, src_port) from python-osc,
-    find the registered (ip, recv_port) we should use to
-    talk back to this IP.
+    Pod values as shown on the dashboard: floats rounded to 2 places.
+    values may be a raw datagram (see PodState.last_data).
+    """
+    if isinstance(values, bytes):
+        values = decode_osc_values(values) or ()
+    return str([round(v, 2) if isinstance(v, float) else v for v in values])
 
-    We use the last registered port for that IP, which is
-    exactly what /register set up.
+
+def open_data_log(prefix):
     """
-    ip, _src_port = client_address
-    with state_lock:
-        key = last_registered_for_ip.get(ip)
-        if key is None:
-            return None, None
-        client = clients.get(key)
-    return key, client
+    Start logging every pod message to PREFIX.NNNN.cbl files. The
+    handler only queues a tuple; caffeine_binlog writes in a thread.
+    """
+    global data_logger, data_log
+    try:
+        import caffeine_binlog
+    except ImportError:
+        sys.exit("--log needs NumPy.")
+    data_logger = caffeine_binlog.BinaryLogger(prefix, caffeine_binlog.BROKER_COLUMNS)
+    data_log = data_logger.log
 
 
-def broadcast_to_pod_clients(pod_name, sensor_data):
+def close_data_log():
+    if data_logger is not None:
+        data_logger.close()
+        if data_logger.bad_records:
+            print(f"--log skipped {data_logger.bad_records} records that didn't "
+                  f"fit its columns.", file=sys.stderr)
+
+
+def open_capture(path):
     """
-    Send sensor_data to all clients subscribed to pod_name.
+    Record every raw ESP32 datagram, with its arrival time, to path.
     """
-    with state_lock:
-        keys = list(pod_subscriptions.get(pod_name, set()))
-        local_clients = {k: clients.get(k) for k in keys}
+    global capture_writer, capture_write
+    import pod_capture
+    capture_writer = pod_capture.CaptureWriter(path)
+    capture_write = capture_writer.write
+
+
+def close_capture():
+    global capture_write
+    if capture_writer is not None:
+        capture_write = None
+        capture_writer.close()
+        print(f"Captured {capture_writer.count} datagrams.")
 
-    for key, client in local_clients.items():
-        if client is None:
-            continue
-        ip, port = key
-        try:
-            client.send_message(pod_name, sensor_data)
-        except Exception as e:
-            print(f"Error sending to client {ip}:{port} for {pod_name}: {e}",
-                  file=sys.stderr)
 
+# ---------------------------------------------------------
+#  PROFILING (--profile, --profile-stacks)
+#  Off by default, when the data path only checks that
+#  profile_stages is None a few times per message. With
+#  --profile every stage of a pod message is timed with
+#  time.perf_counter_ns() (monotonic) and aggregated per
+#  stage:
+#    parse    reading the address of a raw datagram
+#    decode   decoding its values, when the ingest path
+#             needs them (--log)
+#    state    pod state, liveness, history, arrival time
+#    route    broadcast: route lookup, projection,
+#             decimation and encoding
+#    send     broadcast: sendto() calls, send queues and
+#             bundle coalescing
+#    log      handing the message to the --log writer
+#    handler  all of ingest_pod_message() (parse excluded)
+#  The table is printed on shutdown and shown on the
+#  dashboard and /metrics. --profile-stacks also samples
+#  every thread's stack and writes them on shutdown as
+#  folded stacks, the input of flame graph tools.
+# ---------------------------------------------------------
 
-def get_active_pods(now=None):
+class StageProfile:
+    """
+    A LatencyHistogram of per-message times per stage in
+    PROFILE_STAGES, as attributes of the same name, so the data path
+    records with e.g. stages.send.record(ns). The histograms are fed
+    nanoseconds, not microseconds: percentiles cap at ~67 ms, while
+    the sum (total time) stays exact.
     """
-    Return a sorted list of "active" pods based on recent traffic and/or
-    subscriptions.
 
-    A pod is considered active if:
-      - it has sent data within POD_ACTIVE_TIMEOUT seconds, OR
-      - it has at least one subscribed client.
+    __slots__ = PROFILE_STAGES
+
+    def __init__(self):
+        for stage in PROFILE_STAGES:
+            setattr(self, stage, LatencyHistogram())
+
+    def histograms(self):
+        return [(stage, getattr(self, stage)) for stage in PROFILE_STAGES]
+
+
+class StackSampler:
+    """
+    Sampling profiler for --profile-stacks: every `interval` seconds a
+    thread records the Python stack of every other thread, and write()
+    saves the counts as folded stacks ("thread;outer;...;inner count"
+    per line), the input of flamegraph.pl, speedscope and similar
+    tools. Samples are wall-clock, so a thread blocked in select() or
+    a lock shows up there; the stage timings tell work from waiting.
     """
-    if now is None:
-        now = time.time()
 
-    with state_lock:
-        active = set()
+    def __init__(self, path, interval=PROFILE_SAMPLE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.counts = defaultdict(int)
+        self.samples = 0
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name="profiler")
+
+    def run(self):
+        me = threading.get_ident()
+        names = {}
+        while True:
+            time.sleep(self.interval)
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self):
+        with open(self.path, "w") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+        print(f"Wrote {self.samples} stack samples to {self.path}.")
+
+
+def start_profiling(stacks_path=None):
+    """
+    Turn on the stage timers and, with stacks_path, the sampler.
+    """
+    global profile_stages, profile_sampler
+    profile_stages = StageProfile()
+    if stacks_path:
+        profile_sampler = StackSampler(stacks_path)
+        profile_sampler.thread.start()
 
-        # Pods that have sent data recently
-        for name, status in pod_status.items():
-            last_seen = status.get("last_seen")
-            if last_seen is not None and (now - last_seen) <= POD_ACTIVE_TIMEOUT:
-                active.add(name)
 
-        # Pods that have subscribers (even if no data yet)
-        for name, subs in pod_subscriptions.items():
-            if subs:
-                active.add(name)
+def stop_profiling(report=True):
+    """
+    Write the sampled stacks, and print the stage table if report.
+    """
+    global profile_sampler
+    sampler, profile_sampler = profile_sampler, None
+    if sampler is not None:
+        sampler.write()
+    if report and profile_stages is not None:
+        print("Profile (us per message):")
+        print("\n".join(profile_lines()))
 
-    return sorted(active)
+
+def profile_lines():
+    """
+    The stage table (microseconds per message, and each stage's share
+    of the handler's total time) and the lock waits, as text lines.
+    With --workers, the stages are those of all workers, as of their
+    last reports.
+    """
+    stages = profile_stages
+    handler_ns = stages.handler.sum
+    lines = [f"{'Stage':<8} {'n':>9} {'mean':>8} {'p50':>8} {'p99':>8} {'max':>9}"
+             f" {'% handler':>10}"]
+    for stage, hist in stages.histograms():
+        n = hist.total
+        if not n:
+            lines.append(f"{stage:<8} {0:>9}")
+            continue
+        share = 100.0 * hist.sum / handler_ns if handler_ns else 0.0
+        lines.append(f"{stage:<8} {n:>9} {hist.sum / n / 1000:>8.2f} "
+                     f"{hist.percentile(0.50) / 1000:>8.2f} "
+                     f"{hist.percentile(0.99) / 1000:>8.2f} "
+                     f"{hist.max / 1000:>9.2f} {share:>9.1f}%")
+    lines.append("Lock waits: " + ", ".join(
+        f"{name} {count} ({seconds * 1000:.1f} ms)"
+        for name, (count, seconds) in sorted(lock_wait_totals().items())))
+    return lines
 
 
 # ---------------------------------------------------------
@@ -141,32 +2233,111 @@ def get_active_pods(now=None):
 
 def osc_sensor_data_handler(address, *args):
     """
-    Called whenever an ESP32 sends sensor data.
+    Called whenever an ESP32 sends sensor data that python-osc has
+    decoded (--ingest-mode threaded, and messages inside bundles).
     `address` is e.g. "/pod1", "/pod2", etc.
     """
-    pod_name = address
-    sensor_data = list(args)
+    ingest_pod_message(address, args)
 
-    # Round floats for prettier display
-    pretty_data = [round(v, 2) if isinstance(v, float) else v
-                   for v in sensor_data]
 
+def ingest_pod_message(address, args, raw=None):
+    """
+    Record one pod message and forward it to subscribers. Every ingest
+    engine ends up here (utilities/benchmarks/ingest_bench.py replaces
+    it to time ingest alone), so call it through the module global.
+
+    args is the tuple of values, or None when raw, the pod's datagram,
+    is given instead (passthrough): then only the address has been
+    read, and the values are decoded only if something needs them
+    (the --log, projected or rate-limited subscriptions; history keeps
+    the raw datagram and decodes it on /history).
+    Allocates nothing of its own: the values are kept as the pod's
+    last data and forwarded as is (rounded only for display).
+    With --profile, each stage is timed into profile_stages.
+    """
+    t_ns = time.perf_counter_ns()
     now = time.time()
+    stages = profile_stages
+    if stages is not None:
+        decode_ns = 0
+
+    # Update the pod's state (who's "connected"/active and last data).
+    # No lock: each pod's state is written only by the ingest path, and
+    # readers copy the fields they show. (In --ingest-mode threaded two
+    # packets from one pod can race and lose a count; it is display-only.)
+    state = pod_status.get(address)
+    if state is None:
+        state = add_pod(address, now)
+        if state is None:
+            return
+    if args is None and data_log is not None:
+        if stages is not None:
+            t_decode = time.perf_counter_ns()
+        args = decode_osc_values(raw)
+        if stages is not None:
+            decode_ns = time.perf_counter_ns() - t_decode
+            stages.decode.record(decode_ns)
+        if args is None:
+            return  # malformed arguments
+    state.last_seen = now
+    state.last_data = raw if args is None else args
+    state.count += 1
+    if address not in live_pods and track_pod_liveness:
+        mark_pod_up(address, now)
+
+    if state.history is not None:
+        if args is None:
+            state.history.append_raw(now, raw)
+        else:
+            state.history.append(now, args)
 
-    # Update pod_status (who's "connected"/active and last data)
-    with state_lock:
-        status = pod_status.get(pod_name, {
-            "last_seen": now,
-            "last_data": pretty_data,
-            "count": 0
-        })
-        status["last_seen"] = now
-        status["last_data"] = pretty_data
-        status["count"] = status.get("count", 0) + 1
-        pod_status[pod_name] = status
+    latency = state.latency
+    latency.arrival(t_ns)
+    if stages is not None:
+        stages.state.record(time.perf_counter_ns() - t_ns - decode_ns)
 
     # Broadcast to any subscribed clients for this pod
-    broadcast_to_pod_clients(pod_name, pretty_data)
+    sent = broadcast_to_pod_clients(address, args, raw)
+    if sent:
+        state.sent += sent
+        latency.fanout.record((time.perf_counter_ns() - t_ns) // 1000)
+
+    if (data_log is not None and len(args) == len(POD_FIELDS)
+            and all(isinstance(v, (int, float)) for v in args)):
+        if stages is not None:
+            t_log = time.perf_counter_ns()
+        data_log((now, address, *args, sent))
+        if stages is not None:
+            stages.log.record(time.perf_counter_ns() - t_log)
+
+    if stages is not None:
+        stages.handler.record(time.perf_counter_ns() - t_ns)
+
+
+def handle_pod_datagram(data):
+    """
+    Route one raw ESP32 datagram. Pods send plain messages: only their
+    address is read, and the datagram goes to ingest_pod_message()
+    as is. Bundles are unpacked with python-osc for completeness.
+    Malformed packets are dropped.
+    """
+    if capture_write is not None:
+        capture_write(data)
+    stages = profile_stages
+    if stages is not None:
+        t_ns = time.perf_counter_ns()
+    address = pod_datagram_address(data)
+    if address is not None:
+        if stages is not None:
+            stages.parse.record(time.perf_counter_ns() - t_ns)
+        ingest_pod_message(address, None, data)
+        return
+    try:
+        for timed_msg in osc_packet.OscPacket(data).messages:
+            msg = timed_msg.message
+            osc_sensor_data_handler(msg.address, *msg.params)
+    except (osc_message.ParseError, osc_packet.ParseError, UnicodeDecodeError):
+        pass
 
 
 # ---------------------------------------------------------
@@ -186,6 +2357,11 @@ def osc_register_handler(client_address, address, *osc_args):
       - args:
           * recommended: [ recvPort ]
           * optional: [] (fallback: uses sending port)
+          * optional trailing "bundle", ms: collect this client's pod
+            data for up to ms milliseconds and deliver it as one OSC
+            bundle (fewer packets, up to ms of added latency).
+            Registering again without it returns to one packet per
+            message.
 
     For SC-like setups where send-port != recv-port, you MUST
     send the listening port as arg[0].
@@ -194,20 +2370,81 @@ def osc_register_handler(client_address, address, *osc_args):
       /broker, "registered", ip, recvPort
     """
     ip, src_port = client_address
-
-    if len(osc_args) >= 1:
-        recv_port = int(osc_args[0])
+    args = list(osc_args)
+
+    bundle_window = None
+    for i, arg in enumerate(args):
+        if isinstance(arg, str) and arg.lower() == "bundle":
+            try:
+                ms = float(args[i + 1])
+            except (IndexError, TypeError, ValueError):
+                ms = 0.0
+            if ms > 0:
+                bundle_window = min(ms, COALESCE_MAX_MS) / 1000.0
+            del args[i:i + 2]
+            break
+
+    if len(args) >= 1:
+        try:
+            recv_port = int(args[0])
+        except (TypeError, ValueError):
+            recv_port = 0
+        if not 0 < recv_port < 65536:
+            print(f"Received /register from {ip} with bad port {args[0]!r}; ignoring.")
+            return
     else:
         # Fallback: assume sending port is also listening port
         recv_port = src_port
 
-    key = register_client(ip, recv_port)
-    print(f"Registering client {ip}:{recv_port} (source port {src_port})")
+    key = register_client(ip, recv_port, bundle_window)
+    if key is None:
+        print(f"Not registering client {ip}:{recv_port}: "
+              f"MAX_CLIENTS={MAX_CLIENTS} clients already registered.")
+        return
+    mode = f", bundle {bundle_window * 1000:g} ms" if bundle_window else ""
+    print(f"Registering client {ip}:{recv_port} (source port {src_port}{mode})")
 
     # Send a confirmation back to the registered recv_port
-    _, client = get_registered_client_for_request(client_address)
-    if client is not None:
-        client.send_message("/broker", ["registered", ip, recv_port])
+    send_to_client(key, "/broker", ["registered", ip, recv_port])
+
+
+def osc_heartbeat_handler(client_address, address, *osc_args):
+    """
+    Handle /heartbeat messages from clients.
+
+    Protocol:
+      - address: "/heartbeat"
+      - args[0]: recvPort (optional; default: this IP's last /register)
+
+    Renews the client's lease; with --client-timeout, clients must send
+    a control message at least that often (any message renews it).
+    Nothing is sent back while the client is registered. If the broker
+    doesn't know it (evicted, or the broker restarted), the reply is
+      /broker, "unregistered"
+    on recvPort (or the sending port), and the client should /register
+    again.
+    """
+    ip, src_port = client_address
+    if osc_args:
+        try:
+            key = (ip, int(osc_args[0]))
+        except (TypeError, ValueError):
+            key = (ip, 0)
+        if not 0 < key[1] < 65536:
+            print(f"Received /heartbeat from {ip} with bad port {osc_args[0]!r}; ignoring.")
+            return
+        with state_lock:
+            known = key in clients
+            if known:
+                clients[key] = time.time()
+                client_unreachable.pop(key, None)
+    else:
+        key = get_registered_client_for_request(client_address)
+        known = key is not None
+        if not known:
+            key = (ip, src_port)
+    if not known:
+        send_to_client(key, "/broker", ["unregistered"])
 
 
 def osc_list_handler(client_address, address, *osc_args):
@@ -221,14 +2458,17 @@ def osc_list_handler(client_address, address, *osc_args):
 
     Active pods are determined dynamically based on recent traffic and/or
     subscriptions. See get_active_pods().
+    Registered clients are also pushed /broker, "pod_up" / "pod_down",
+    pod_name as pods start and stop sending, so one /list on startup
+    is enough.
 
     Reply is sent as:
       /broker, "pod_list", pod1, pod2, ...
     """
-    key, client = get_registered_client_for_request(client_address)
+    key = get_registered_client_for_request(client_address)
     ip, _src_port = client_address
 
-    if client is None:
+    if key is None:
         print(f"Received /list from unregistered IP {ip}; "
               f"call /register first.")
         return
@@ -236,7 +2476,7 @@ def osc_list_handler(client_address, address, *osc_args):
     pods = get_active_pods()
     print(f"Sending dynamic pod list to {key[0]}:{key[1]} -> {pods}")
     # First arg is a tag "pod_list", remaining args are pod names
-    client.send_message("/broker", ["pod_list"] + pods)
+    send_to_client(key, "/broker", ["pod_list"] + pods)
 
 
 def osc_connect_handler(client_address, address, *osc_args):
@@ -245,28 +2485,94 @@ def osc_connect_handler(client_address, address, *osc_args):
 
     Protocol:
       - address: "/connect"
-      - args[0]: pod_name (e.g. "/pod1")
-
-    The client subscribes to that pod's data stream.
+      - args: one or more pod names (e.g. "/pod1"), then optionally,
+        in any order:
+          * field names to receive, from x, y, z, sound, distance,
+            light (or indices 0-5)
+          * "rate", hz     cap on messages/s forwarded to this client
+          * "latest"|"avg" decimation: newest sample (default) or the
+                           mean of the samples since the last send
+          * "multicast"    receive the stream on the broker's multicast
+                           group instead: the port is announced with
+                           /broker, "multicast", pod_name, group, port
+                           (/broker, "multicast_off", pod_name and
+                           unicast if the broker has no group)
+
+    A pod name may be an OSC pattern (* ? [1-4] [!5] {1,7}); it
+    subscribes the client to every matching pod, including pods that
+    appear later. With fields, only those values are forwarded, in
+    the order given; connecting again replaces the options. The
+    options apply to every pod named. Examples:
+      /connect, "/pod1", "x", "rate", 30
+      /connect, "/pod1", "/pod2", "/pod[5-8]"
+      /connect, "/pod1", "multicast"
     """
-    if not osc_args:
+    pod_names = []
+    for arg in osc_args:
+        if not (isinstance(arg, str) and arg.startswith("/")):
+            break
+        pod_names.append(arg)
+    if not pod_names:
         print("Received /connect with no pod_name; ignoring.")
         return
 
-    pod_name = str(osc_args[0])
-    key, client = get_registered_client_for_request(client_address)
+    key = get_registered_client_for_request(client_address)
     ip, _src_port = client_address
 
-    if client is None:
+    if key is None:
         print(f"Received /connect from unregistered IP {ip}; "
               f"call /register first.")
         return
 
-    with state_lock:
-        pod_subscriptions[pod_name].add(key)
-        client_subscriptions[key].add(pod_name)
+    sub, bad = parse_connect_options(osc_args[len(pod_names):])
+    patterns = {}
+    for pod_name in pod_names:
+        if is_pod_pattern(pod_name):
+            try:
+                patterns[pod_name] = compile_pod_pattern(pod_name)
+            except ValueError as e:
+                bad.append(str(e))
+    if bad:
+        print(f"Client {key[0]}:{key[1]} CONNECT -> {' '.join(pod_names)}: "
+              f"unknown option(s) {bad}; fields: {', '.join(POD_FIELDS)}; "
+              f"options: rate <hz>, latest, avg, multicast. Ignoring.")
+        return
+    if sub.multicast and MULTICAST_GROUP is None:
+        sub = sub._replace(multicast=False)
+        for pod_name in pod_names:
+            send_to_client(key, "/broker", ["multicast_off", pod_name])
 
-    print(f"Client {key[0]}:{key[1]} CONNECT -> {pod_name}")
+    with state_lock:
+        for pod_name in pod_names:
+            if pod_name in patterns:
+                # Re-insert so the newest pattern wins on overlap
+                client_patterns[key].pop(pod_name, None)
+                client_patterns[key][pod_name] = (patterns[pod_name], sub)
+                excluded = pattern_exclusions.get(key)
+                if excluded:
+                    excluded.difference_update(
+                        [name for name in excluded if patterns[pod_name](name)])
+            else:
+                pod_subscriptions[pod_name].add(key)
+                client_subscriptions[key][pod_name] = sub
+                pattern_exclusions.get(key, set()).discard(pod_name)
+        if key in pattern_exclusions and not pattern_exclusions[key]:
+            del pattern_exclusions[key]
+        if patterns:
+            resolve_all_pod_patterns()
+        announce = ()
+        if sub.multicast:
+            # Every multicast /connect is answered, not only the first
+            # join: a restarted client on the same ip:port needs it too
+            announce = {(key, pod_name) for pod_name in pod_names
+                        if pod_name not in patterns}
+            announce.update((key, pod_name) for pod_name, routes in pattern_routes.items()
+                            if key in routes
+                            and any(match(pod_name) for match in patterns.values()))
+        rebuild_routing_table(announce)
+
+    for pod_name in pod_names:
+        print(f"Client {key[0]}:{key[1]} CONNECT -> {describe_subscription(pod_name, sub)}")
 
 
 def osc_disconnect_handler(client_address, address, *osc_args):
@@ -275,53 +2581,223 @@ def osc_disconnect_handler(client_address, address, *osc_args):
 
     Protocol:
       - address: "/disconnect"
-      - args[0]: pod_name (e.g. "/pod1")
+      - args: one or more pod names or patterns, as given to /connect
 
-    The client stops receiving messages from that pod.
+    The client stops receiving messages from those pods. A pattern
+    removes that pattern subscription; a literal name also excludes
+    the pod from the client's patterns, so it stays off until the
+    client /connects it by name or connects a matching pattern again.
     """
-    if not osc_args:
+    pod_names = [str(arg) for arg in osc_args]
+    if not pod_names:
         print("Received /disconnect with no pod_name; ignoring.")
         return
 
-    pod_name = str(osc_args[0])
-    key, client = get_registered_client_for_request(client_address)
+    key = get_registered_client_for_request(client_address)
     ip, _src_port = client_address
 
-    if client is None:
+    if key is None:
         print(f"Received /disconnect from unregistered IP {ip}; "
               f"call /register first.")
         return
 
-    removed = 0
+    removed = {}
     with state_lock:
-        if pod_name in pod_subscriptions and key in pod_subscriptions[pod_name]:
-            pod_subscriptions[pod_name].remove(key)
-            removed = 1
-            if not pod_subscriptions[pod_name]:
-                del pod_subscriptions[pod_name]
+        for pod_name in pod_names:
+            removed[pod_name] = 0
+            if key in client_patterns and pod_name in client_patterns[key]:
+                del client_patterns[key][pod_name]
+                if not client_patterns[key]:
+                    del client_patterns[key]
+                    pattern_exclusions.pop(key, None)
+                resolve_all_pod_patterns()
+                removed[pod_name] = 1
+                continue
+
+            if pod_name in pod_subscriptions and key in pod_subscriptions[pod_name]:
+                pod_subscriptions[pod_name].remove(key)
+                removed[pod_name] = 1
+                if not pod_subscriptions[pod_name]:
+                    del pod_subscriptions[pod_name]
+
+            if key in client_subscriptions and pod_name in client_subscriptions[key]:
+                del client_subscriptions[key][pod_name]
+                if not client_subscriptions[key]:
+                    del client_subscriptions[key]
+
+            if any(match(pod_name) for match, _sub in client_patterns.get(key, {}).values()):
+                pattern_exclusions[key].add(pod_name)
+                if key in pattern_routes.get(pod_name, {}):
+                    del pattern_routes[pod_name][key]
+                    removed[pod_name] = 1
+                    if not pattern_routes[pod_name]:
+                        del pattern_routes[pod_name]
+
+        if any(removed.values()):
+            rebuild_routing_table()
+
+    for pod_name, n in removed.items():
+        print(f"Client {key[0]}:{key[1]} DISCONNECT -> {pod_name} (removed {n})")
+
+
+def osc_history_handler(client_address, address, *osc_args):
+    """
+    Handle /history messages from clients.
+
+    Protocol:
+      - address: "/history"
+      - args[0]: pod_name (e.g. "/pod1")
+      - args[1]: seconds of history wanted (optional; default: all kept)
+
+    Replies to the registered client with:
+      /broker, "history", pod_name, n
+      n samples as bundles of /history/podN, time (d), v1..v6 (f)
+      /broker, "history_end", pod_name, n
+    """
+    if not osc_args:
+        print("Received /history with no pod_name; ignoring.")
+        return
+
+    pod_name = str(osc_args[0])
+    key = get_registered_client_for_request(client_address)
+    ip, _src_port = client_address
+
+    if key is None:
+        print(f"Received /history from unregistered IP {ip}; "
+              f"call /register first.")
+        return
+
+    try:
+        seconds = float(osc_args[1]) if len(osc_args) >= 2 else HISTORY_SECONDS
+    except (TypeError, ValueError):
+        seconds = HISTORY_SECONDS
+    seconds = max(0.0, min(seconds, HISTORY_MAX_SECONDS))
+
+    if pod_name not in pod_status or not history_enabled():
+        send_to_client(key, "/broker", ["history", pod_name, 0])
+        send_to_client(key, "/broker", ["history_end", pod_name, 0])
+        print(f"Client {key[0]}:{key[1]} HISTORY -> {pod_name} (no history)")
+        return
+
+    if worker_route_conns:
+        # Sharded ingest: the worker that owns the pod holds its history
+        for conn in worker_route_conns:
+            try:
+                conn.send(("history", key, pod_name, seconds))
+            except OSError:
+                pass
+        print(f"Client {key[0]}:{key[1]} HISTORY -> {pod_name} ({seconds:g} s, via workers)")
+        return
+
+    n = send_history(key, pod_name, seconds)
+    print(f"Client {key[0]}:{key[1]} HISTORY -> {pod_name} ({seconds:g} s, {n} samples)")
+
+
+def osc_latency_handler(client_address, address, *osc_args):
+    """
+    Handle /latency messages from clients.
+
+    Protocol:
+      - address: "/latency"
+      - args: optional pod names or patterns (default: every pod seen)
+
+    Replies to the registered client, per pod and metric, with:
+      /broker, "latency", pod_name, metric, n, p50, p99, p99.9, max
+    where metric is "fanout" or "jitter" and times are in ms (f).
+    """
+    key = get_registered_client_for_request(client_address)
+    ip, _src_port = client_address
 
-        if key in client_subscriptions and pod_name in client_subscriptions[key]:
-            client_subscriptions[key].remove(pod_name)
-            if not client_subscriptions[key]:
-                del client_subscriptions[key]
+    if key is None:
+        print(f"Received /latency from unregistered IP {ip}; "
+              f"call /register first.")
+        return
 
-    print(f"Client {key[0]}:{key[1]} DISCONNECT -> {pod_name} (removed {removed})")
+    pods = sorted(pod_status)
+    if osc_args:
+        wanted = []
+        for arg in map(str, osc_args):
+            try:
+                match = compile_pod_pattern(arg)
+            except ValueError:
+                continue
+            wanted += [name for name in pods if match(name)]
+        pods = sorted(set(wanted))
+
+    for pod_name in pods:
+        state = pod_status.get(pod_name)
+        if state is None:
+            continue  # forgotten meanwhile
+        for metric in ("fanout", "jitter"):
+            send_to_client(key, "/broker",
+                           ["latency", pod_name, metric, *state.latency.summary(metric)])
+    print(f"Client {key[0]}:{key[1]} LATENCY -> {', '.join(pods) or '(no pods)'}")
 
 
 # ---------------------------------------------------------
 #  SERVER STARTERS
 # ---------------------------------------------------------
 
-def start_osc_esp32_server():
-    disp = dispatcher.Dispatcher()
-    # Accept any address like "/pod1", "/pod2", ...
-    disp.map("/*", osc_sensor_data_handler)
-    osc_srv = osc_server.ThreadingOSCUDPServer((HOST, ESP32_PORT), disp)
-    print(f"Listening for ESP32 OSC data on port {ESP32_PORT}...")
-    osc_srv.serve_forever()
+def open_esp32_socket(reuse_port=False):
+    """
+    Bind the ESP32 data port for the batched ingest loop, with a
+    receive buffer of INGEST_RCVBUF_BYTES (--rcvbuf; 0 keeps the OS
+    default). With reuse_port, several worker processes can bind the
+    same port (SO_REUSEPORT) and the kernel spreads pods across them.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if INGEST_RCVBUF_BYTES > 0:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                            INGEST_RCVBUF_BYTES)
+        except OSError:
+            pass  # keep the OS default
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((HOST, ESP32_PORT))
+    sock.setblocking(False)
+    return sock
+
+
+def batched_ingest_loop(sock, batch_size=INGEST_BATCH_SIZE):
+    """
+    Single-threaded ESP32 ingest: sleep in select() until the socket is
+    readable, then drain up to `batch_size` datagrams before sleeping
+    again. No thread is created per packet, so a datagram that breaks
+    the handler is dropped here instead of ending the loop.
+    """
+    recv = sock.recv
+    while True:
+        select.select([sock], [], [])
+        for _ in range(batch_size):
+            try:
+                data = recv(65535)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # e.g. ICMP errors reported on the socket; keep going
+                continue
+            try:
+                handle_pod_datagram(data)
+            except Exception as e:
+                warn_ingest_error(data, e)
+
+
+def start_osc_esp32_server(ingest_mode="batched"):
+    if ingest_mode == "threaded":
+        disp = dispatcher.Dispatcher()
+        # Accept any address like "/pod1", "/pod2", ...
+        disp.map("/*", osc_sensor_data_handler)
+        osc_srv = osc_server.ThreadingOSCUDPServer((HOST, ESP32_PORT), disp)
+        print(f"Listening for ESP32 OSC data on port {ESP32_PORT} (threaded)...")
+        osc_srv.serve_forever()
+    else:
+        sock = open_esp32_socket()
+        print(f"Listening for ESP32 OSC data on port {ESP32_PORT} (batched)...")
+        batched_ingest_loop(sock)
 
 
-def start_osc_registration_server():
+def make_control_dispatcher():
     disp = dispatcher.Dispatcher()
 
     # needs_reply_address=True so our handlers get client_address
@@ -329,7 +2805,14 @@ def start_osc_registration_server():
     disp.map("/list",       osc_list_handler,       needs_reply_address=True)
     disp.map("/connect",    osc_connect_handler,    needs_reply_address=True)
     disp.map("/disconnect", osc_disconnect_handler, needs_reply_address=True)
+    disp.map("/latency",    osc_latency_handler,    needs_reply_address=True)
+    disp.map("/history",    osc_history_handler,    needs_reply_address=True)
+    disp.map("/heartbeat",  osc_heartbeat_handler,  needs_reply_address=True)
+    return disp
 
+
+def start_osc_registration_server():
+    disp = make_control_dispatcher()
     osc_srv = osc_server.ThreadingOSCUDPServer((HOST, BROKER_OSC_PORT), disp)
     print(f"Listening for client control on OSC port {BROKER_OSC_PORT}...")
     osc_srv.serve_forever()
@@ -339,129 +2822,932 @@ def start_osc_registration_server():
 #  STATUS DISPLAY / DASHBOARD
 # ---------------------------------------------------------
 
-def status_display_loop(refresh_interval=0.5, idle_msg_interval=3.0):
+class StatusDashboard:
     """
-    Periodically redraw a simple "dashboard" showing:
-      - one line per pod: name, last-seen age, message count, last data
+    Terminal dashboard showing:
+      - one line per pod: name, last-seen age, message rate (Hz),
+        fan-out rate (sends/s) and last data
       - active pods (as used by /list)
       - client subscriptions per pod
+      - fan-out and jitter percentiles per pod
+      - with --profile, time per data path stage
       - registered clients
 
-    Uses ANSI escape codes to clear the screen and avoid scroll.
+    Each frame is built from one lock-free snapshot (pod_status copy
+    plus the published routing_table / client_view), and only the
+    lines that changed since the previous frame are rewritten, using
+    ANSI cursor addressing.
     """
-    last_idle_msg_time = 0.0
 
-    while True:
-        # Snapshot state under lock to avoid races
-        with state_lock:
-            pods_snapshot = {
-                name: status.copy()
-                for name, status in pod_status.items()
-            }
-            subs_snapshot = {
-                pod: set(subs)
-                for pod, subs in pod_subscriptions.items()
-            }
-            clients_snapshot = dict(clients)
-            last_reg_snapshot = dict(last_registered_for_ip)
-
-        # Clear screen and move cursor to top-left
-        print("\033[2J\033[H", end="")
-
-        print("CAFFEINE OSC Broker - Pod Status")
-        print("--------------------------------\n")
+    def __init__(self):
+        self.prev_lines = []
+        self.prev_counts = {}
+        self.prev_time = None
+
+    def build_lines(self):
+        states = dict(pod_status)
+        pods_snapshot = {
+            name: (st.last_seen, st.last_data)
+            for name, st in states.items()
+        }
+        routes = routing_table
+        view = client_view
+
+        mono = time.monotonic()
+        dt = (mono - self.prev_time) if self.prev_time is not None else 0.0
+        counts = {name: (st.count, st.sent) for name, st in states.items()}
+
+        lines = ["CAFFEINE OSC Broker - Pod Status",
+                 "--------------------------------",
+                 ""]
 
         if not pods_snapshot:
-            print("No pods have sent data yet.")
+            lines.append("No pods have sent data yet.")
+            lines.append("")
+            lines.append("Waiting for pods to send data...")
         else:
-            print(f"{'Pod':<8} {'Last Seen (s ago)':<18} {'Messages':<9} Last Data")
-            print("-" * 70)
+            lines.append(f"{'Pod':<8} {'Last Seen (s ago)':<18} {'Msg/s':>7} "
+                         f"{'Fan-out/s':>10}  Last Data")
+            lines.append("-" * 78)
             now = time.time()
-            for pod_name in sorted(pods_snapshot.keys()):
-                st = pods_snapshot[pod_name]
-                age = now - st.get("last_seen", now)
-                age_str = f"{age:5.1f}"
-                count = st.get("count", 0)
-                last_data = st.get("last_data", [])
-                print(f"{pod_name:<8} {age_str:<18} {count:<9} {last_data}")
-
-        print("\nActive pods (for /list):")
-        print("------------------------")
+            for pod_name in sorted(pods_snapshot):
+                last_seen, last_data = pods_snapshot[pod_name]
+                age = now - last_seen
+                count, sent = counts[pod_name]
+                prev_count, prev_sent = self.prev_counts.get(pod_name, (count, sent))
+                if dt > 0:
+                    msg_rate = (count - prev_count) / dt
+                    fan_rate = (sent - prev_sent) / dt
+                else:
+                    msg_rate = fan_rate = 0.0
+                lines.append(f"{pod_name:<8} {age:5.1f}{'':<13} {msg_rate:>7.1f} "
+                             f"{fan_rate:>10.1f}  {display_values(last_data)}")
+
+        lines += ["", "Active pods (for /list):", "------------------------"]
         active_pods = get_active_pods()
-        if not active_pods:
-            print("(none)")
-        else:
-            print(", ".join(active_pods))
+        lines.append(", ".join(active_pods) if active_pods else "(none)")
 
-        print("\nPod subscriptions:")
-        print("------------------")
-        if not subs_snapshot:
-            print("(no subscriptions)")
+        lines += ["", "Pod subscriptions:", "------------------"]
+        if not routes:
+            lines.append("(no subscriptions)")
         else:
-            for pod_name in sorted(subs_snapshot.keys()):
-                keys = sorted(subs_snapshot[pod_name])
-                if not keys:
-                    print(f"{pod_name}: (no clients)")
-                else:
-                    rendered = [f"{ip}:{port}" for (ip, port) in keys]
-                    print(f"{pod_name}: {', '.join(rendered)}")
-
-        print("\nRegistered clients:")
-        print("-------------------")
-        if not clients_snapshot:
-            print("(none)")
+            for pod_name in sorted(routes):
+                rendered = []
+                for route in routes[pod_name]:
+                    label = describe_subscription("", route.sub)
+                    if route.listeners:
+                        (group, port), = route.dests
+                        rendered.append(f"{group}:{port}{label} "
+                                        f"({len(route.listeners)} listening)")
+                        continue
+                    rendered += [f"{ip}:{port}{label}" for (ip, port) in route.dests]
+                    rendered += [f"{ip}:{port}{label}" for (ip, port), _w in route.batched]
+                lines.append(f"{pod_name}: {', '.join(rendered)}")
+
+        lines += ["", "Latency (ms; fan-out = handler to last send):",
+                  "---------------------------------------------"]
+        latencies = {name: st.latency for name, st in states.items()}
+        if not latencies:
+            lines.append("(no data)")
         else:
-            for (ip, port) in sorted(clients_snapshot.keys()):
-                # Show which pods they are subscribed to (if any)
-                with state_lock:
-                    pods_for_client = sorted(client_subscriptions.get((ip, port), []))
-                if pods_for_client:
-                    pods_str = ", ".join(pods_for_client)
-                else:
-                    pods_str = "(no pods)"
-                marker = ""
-                if last_reg_snapshot.get(ip) == (ip, port):
-                    marker = "  [last /register]"
-                print(f"{ip}:{port} -> {pods_str}{marker}")
-
-        print("\nControls:")
-        print("---------")
-        print("  1) Client sends /register, recvPort")
-        print("       (recvPort = client's OSC listening port)")
-        print("  2) Client sends /list")
-        print("  3) Client sends /connect, pod_name to subscribe.")
-        print("  4) Client sends /disconnect, pod_name to unsubscribe.")
-        print("\nAll broker announcements are sent on /broker.")
-        print("Pod data is forwarded on /podN (e.g. /pod1, /pod2, ...).")
-        print("\nPress Ctrl+C in this terminal to stop the broker.")
-
-        # Optional little heartbeat message when idle
-        now = time.time()
-        if not pods_snapshot and (now - last_idle_msg_time) > idle_msg_interval:
-            print("\nWaiting for pods to send data...")
-            last_idle_msg_time = now
-
+            lines.append(f"{'Pod':<8} {'Fan-out p50':>11} {'p99':>7} {'p99.9':>7}"
+                         f"   {'Jitter p50':>10} {'p99':>7} {'p99.9':>7}")
+            for pod_name in sorted(latencies):
+                latency = latencies[pod_name]
+                _n, *fan, _max = latency.summary("fanout")
+                _n, *jit, _max = latency.summary("jitter")
+                lines.append(f"{pod_name:<8} {fan[0]:>11.3f} {fan[1]:>7.3f} {fan[2]:>7.3f}"
+                             f"   {jit[0]:>10.3f} {jit[1]:>7.3f} {jit[2]:>7.3f}")
+
+        if profile_stages is not None:
+            lines += ["", "Profile (us per message, --profile):",
+                      "------------------------------------"]
+            lines += profile_lines()
+
+        lines += ["", "Registered clients:", "-------------------"]
+        clients_view = view["clients"]
+        last_reg = view["last_registered"]
+        if not clients_view:
+            lines.append("(none)")
+        else:
+            for (ip, port) in sorted(clients_view):
+                pods_for_client = clients_view[(ip, port)]
+                pods_str = ", ".join(pods_for_client) if pods_for_client else "(no pods)"
+                marker = "  [last /register]" if last_reg.get(ip) == (ip, port) else ""
+                window = view["bundle_window"].get((ip, port))
+                if window:
+                    marker = f"  [bundle {window * 1000:g} ms]" + marker
+                queued = len(send_queues.get((ip, port), ()))
+                dropped = send_drops.get((ip, port))
+                errors = send_errors.get((ip, port))
+                if queued:
+                    marker += f"  [queued {queued}]"
+                if dropped:
+                    marker += f"  [dropped {dropped}]"
+                if errors:
+                    marker += f"  [send errors {errors}]"
+                lines.append(f"{ip}:{port} -> {pods_str}{marker}")
+
+        lines += ["",
+                  "Controls:",
+                  "---------",
+                  "  1) Client sends /register, recvPort [, \"bundle\", ms]",
+                  "       (recvPort = client's OSC listening port)",
+                  "  2) Client sends /list",
+                  "  3) Client sends /connect, pod_name [, ...] [, field ...] to subscribe",
+                  "       (pod names may be patterns: /pod* /pod[1-4];",
+                  "        fields: " + " ".join(POD_FIELDS) + ";",
+                  "        \"rate\", hz [, \"avg\"] to limit the rate;",
+                  "        \"multicast\" to receive it on a multicast group)",
+                  "  4) Client sends /disconnect, pod_name [, ...] to unsubscribe.",
+                  "  5) Client sends /heartbeat [, recvPort] to keep its registration",
+                  "       (needed with --client-timeout).",
+                  "",
+                  "All broker announcements are sent on /broker.",
+                  "Pod data is forwarded on /podN (e.g. /pod1, /pod2, ...).",
+                  "",
+                  "Press Ctrl+C in this terminal to stop the broker."]
+
+        self.prev_counts = counts
+        self.prev_time = mono
+        return lines
+
+    def draw(self):
+        lines = self.build_lines()
+
+        # Keep the frame within the terminal so cursor addressing holds
+        rows = shutil.get_terminal_size().lines - 1
+        if len(lines) > rows > 1:
+            hidden = len(lines) - rows + 1
+            lines = lines[:rows - 1] + [f"... ({hidden} more lines)"]
+
+        out = []
+        if not self.prev_lines:
+            out.append("\033[2J")
+        prev = self.prev_lines
+        for i, line in enumerate(lines):
+            if i >= len(prev) or prev[i] != line:
+                out.append(f"\033[{i + 1};1H{line}\033[K")
+        if len(lines) < len(prev):
+            out.append(f"\033[{len(lines) + 1};1H\033[J")
+        out.append(f"\033[{len(lines) + 1};1H")
+
+        sys.stdout.write("".join(out))
         sys.stdout.flush()
+        self.prev_lines = lines
+
+
+def status_display_loop(refresh_interval=0.5):
+    """
+    Redraw the dashboard every `refresh_interval` seconds (thread engine).
+    """
+    dashboard = StatusDashboard()
+    while True:
+        dashboard.draw()
         time.sleep(refresh_interval)
 
 
 # ---------------------------------------------------------
+#  METRICS (--metrics-port)
+#  Prometheus text format at http://HOST:PORT/metrics, built
+#  at scrape time from the counters the broker keeps anyway
+#  (pod status, send counters, timed locks), so the data
+#  path does no extra work for a scrape. Served by
+#  http.server on a thread, or on the asyncio event loop.
+# ---------------------------------------------------------
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _metric_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def lock_wait_totals():
+    """
+    {lock name: [waits, wait seconds]} over this process and, with
+    --workers, the workers' latest reports.
+    """
+    waits = {name: [lock.waits, lock.wait_seconds] for name, lock in timed_locks.items()}
+    for _depths, worker_waits in list(worker_egress.values()):
+        for name, (count, seconds) in worker_waits.items():
+            total = waits.setdefault(name, [0, 0.0])
+            total[0] += count
+            total[1] += seconds
+    return waits
+
+
+def render_metrics():
+    """
+    Return the current metrics as Prometheus text exposition format.
+    With --workers, per-client counters include the workers' reports,
+    and queue depths and lock waits are summed over all processes.
+    """
+    states = dict(pod_status)
+    routes = routing_table
+    view = client_view
+    now = time.time()
+
+    depths = defaultdict(int)
+    for key, queue in list(send_queues.items()):
+        depths[key] += len(queue)
+    for worker_depths, _waits in list(worker_egress.values()):
+        for key, depth in worker_depths.items():
+            depths[key] += depth
+    waits = lock_wait_totals()
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        """
+        samples are (labels, value), or (suffix, labels, value) for the
+        _sum and _count series of a summary.
+        """
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for *suffix, labels, value in samples:
+            series = name + "".join(suffix)
+            if isinstance(value, float):
+                value = f"{value:.9g}"
+            if labels:
+                text = ",".join(f'{label}="{_metric_label(v)}"' for label, v in labels)
+                lines.append(f"{series}{{{text}}} {value}")
+            else:
+                lines.append(f"{series} {value}")
+
+    pods = sorted(states)
+    metric("caffeine_pod_messages_total", "counter",
+           "Messages received from the pod.",
+           [((("pod", n),), states[n].count) for n in pods])
+    metric("caffeine_pod_sends_total", "counter",
+           "Messages forwarded for the pod, one per destination (a "
+           "multicast stream counts once).",
+           [((("pod", n),), states[n].sent) for n in pods])
+    metric("caffeine_pod_last_seen_age_seconds", "gauge",
+           "Seconds since the pod last sent.",
+           [((("pod", n),), now - states[n].last_seen) for n in pods])
+    for kind in ("fanout", "jitter"):
+        samples = []
+        for n in pods:
+            count, *percentiles, _max = states[n].latency.summary(kind)
+            samples += [((("pod", n), ("quantile", q)), ms / 1000.0)
+                        for q, ms in zip(LATENCY_PERCENTILES, percentiles)]
+            samples.append(("_sum", (("pod", n),),
+                            getattr(states[n].latency, kind).sum / 1e6))
+            samples.append(("_count", (("pod", n),), count))
+        metric(f"caffeine_pod_{kind}_seconds", "summary",
+               "Fan-out time (handler to last send)." if kind == "fanout"
+               else "Inter-arrival jitter.", samples)
+    metric("caffeine_pod_subscriptions", "gauge",
+           "Clients subscribed to the pod.",
+           [((("pod", n),), sum(len(r.dests) + len(r.batched) if not r.listeners
+                                else len(r.listeners) for r in routes[n]))
+            for n in sorted(routes)])
+    metric("caffeine_pods_live", "gauge",
+           "Pods that sent within the activity timeout.", [((), len(live_pods))])
+    metric("caffeine_clients", "gauge",
+           "Registered clients.", [((), len(view["clients"]))])
+
+    def client_samples(counts):
+        return [((("client", f"{ip}:{port}"),), count)
+                for (ip, port), count in sorted(counts.items())]
+
+    metric("caffeine_client_messages_sent_total", "counter",
+           "Pod messages sent to the client (or multicast group:port).",
+           client_samples(client_sent_totals()))
+    metric("caffeine_client_send_errors_total", "counter",
+           "Failed sends to the client.", client_samples(dict(send_errors)))
+    metric("caffeine_client_send_drops_total", "counter",
+           "Messages dropped from the client's full send queue.",
+           client_samples(dict(send_drops)))
+    metric("caffeine_client_send_queue_depth", "gauge",
+           "Messages waiting in the client's send queue.", client_samples(depths))
+    metric("caffeine_lock_waits_total", "counter",
+           "Lock entries that had to wait.",
+           [((("lock", name),), count) for name, (count, _s) in sorted(waits.items())])
+    metric("caffeine_lock_wait_seconds_total", "counter",
+           "Seconds spent waiting for the lock.",
+           [((("lock", name),), seconds) for name, (_c, seconds) in sorted(waits.items())])
+    if profile_stages is not None:
+        hists = profile_stages.histograms()
+        metric("caffeine_stage_messages_total", "counter",
+               "Pod messages timed in the data path stage (--profile).",
+               [((("stage", stage),), hist.total) for stage, hist in hists])
+        metric("caffeine_stage_seconds_total", "counter",
+               "Seconds spent in the data path stage (--profile).",
+               [((("stage", stage),), hist.sum / 1e9) for stage, hist in hists])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    GET /metrics for the thread engine.
+    """
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep the dashboard clean
+
+
+def start_metrics_server(host, port):
+    server = http.server.ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+
+
+# ---------------------------------------------------------
+#  SHARDED INGEST (--workers N)
+#  N worker processes each bind the ESP32 port with
+#  SO_REUSEPORT and run the batched ingest loop, forwarding
+#  with broadcast_to_pod_clients() as usual. The main process
+#  keeps the control server and dashboard, replicates every
+#  routing snapshot to the workers over a pipe, and merges
+#  the pod status the workers report back.
+# ---------------------------------------------------------
+
+def _worker_route_listener(conn):
+    """
+    Worker side of the replication channel: swap in each routing
+    snapshot and pattern snapshot sent by the main process (see
+    add_worker_pattern_routes()), and answer /history requests
+    for pods this worker has received. Exits the worker when the main
+    process goes away.
+    """
+    global routing_table
+    parent = multiprocessing.parent_process()
+    waitables = [conn] + ([parent.sentinel] if parent is not None else [])
+    while True:
+        ready = multiprocessing.connection.wait(waitables)
+        if conn not in ready:
+            close_worker_outputs()
+            os._exit(0)
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            close_worker_outputs()
+            os._exit(0)
+        if isinstance(msg, dict):
+            with state_lock:  # vs add_worker_pattern_routes()
+                old_table = routing_table
+                routing_table = carry_decimators(msg, old_table)
+            settle_client_sent(old_table)
+        elif msg[0] == "patterns":
+            apply_pattern_snapshot(msg[1])
+        elif msg[0] == "history":
+            _, key, pod_name, seconds = msg
+            state = pod_status.get(pod_name)
+            if state is not None and state.history is not None:
+                send_history(key, pod_name, seconds)
+
+
+def _worker_status_reporter(status_queue, interval):
+    """
+    Periodically send {pod: (last_seen, last_data, new_count, new_sent,
+    latency)} for pods this worker has seen since the previous report,
+    where latency holds the (delta, max) of the fan-out and jitter
+    histograms (see LatencyHistogram.delta()). Idle pods are forgotten here too (POD_TIMEOUT),
+    so the bookkeeping for them goes in the same step. Egress counters
+    go as ("send_stats", (pid, {client: new (sent, drops, errors)},
+    {client: queue depth}, {lock: (waits, wait seconds)})) when they
+    change, and with --profile the stage timings as ("profile",
+    {stage: (delta, max)}).
+    """
+    reported = {}
+    reported_latency = {}
+    reported_send = {}
+    reported_egress = None
+    reported_stages = {}
+    empty = LatencyHistogram.EMPTY_SNAPSHOT
+    next_janitor = time.time() + LIVENESS_INTERVAL
+    while True:
+        time.sleep(interval)
+        now = time.time()
+        if POD_TIMEOUT > 0 and now >= next_janitor:
+            next_janitor = now + LIVENESS_INTERVAL
+            for name in expire_pods(now, POD_TIMEOUT):
+                reported.pop(name, None)
+                reported_latency.pop(name, None)
+        report = {}
+        for name, state in list(pod_status.items()):
+            count, sent = state.count, state.sent
+            prev_count, prev_sent = reported.get(name, (0, 0))
+            if count != prev_count:
+                latency = state.latency
+                prev_fanout, prev_jitter = reported_latency.get(name, (empty, empty))
+                fanout_delta, fanout = latency.fanout.delta(prev_fanout)
+                jitter_delta, jitter = latency.jitter.delta(prev_jitter)
+                report[name] = (state.last_seen, state.last_data,
+                                count - prev_count, sent - prev_sent,
+                                ((fanout_delta, latency.fanout.max),
+                                 (jitter_delta, latency.jitter.max)))
+                reported[name] = (count, sent)
+                reported_latency[name] = (fanout, jitter)
+        if report:
+            status_queue.put(report)
+        send_stats = {}
+        sent_totals = client_sent_totals()
+        for key in set(sent_totals) | set(send_drops) | set(send_errors):
+            counts = (sent_totals.get(key, 0), send_drops.get(key, 0),
+                      send_errors.get(key, 0))
+            prev = reported_send.get(key, (0, 0, 0))
+            if counts != prev:
+                send_stats[key] = tuple(c - p for c, p in zip(counts, prev))
+                reported_send[key] = counts
+        depths = {key: len(queue) for key, queue in list(send_queues.items())}
+        waits = {name: (lock.waits, lock.wait_seconds)
+                 for name, lock in timed_locks.items()}
+        if send_stats or (depths, waits) != reported_egress:
+            reported_egress = (depths, waits)
+            status_queue.put(("send_stats", (os.getpid(), send_stats, depths, waits)))
+        if profile_stages is not None:
+            stage_stats = {}
+            for stage, hist in profile_stages.histograms():
+                prev, prev_n = reported_stages.get(stage, (empty, 0))
+                n = hist.total
+                if n != prev_n:
+                    delta, current = hist.delta(prev)
+                    stage_stats[stage] = (delta, hist.max)
+                    reported_stages[stage] = (current, n)
+            if stage_stats:
+                status_queue.put(("profile", stage_stats))
+
+
+def close_worker_outputs():
+    """
+    Flush what a worker writes itself: its --log, --capture and
+    --profile-stacks files (its stage timings go to the main process).
+    """
+    close_data_log()
+    close_capture()
+    stop_profiling(report=False)
+
+
+def run_ingest_worker(host, port, history_seconds, pod_timeout, route_conn,
+                      status_queue, log_prefix=None, capture_path=None,
+                      send_options=(SEND_QUEUE_DEPTH, SEND_POLICY, SENDER_LANES),
+                      multicast=(MULTICAST_GROUP, MULTICAST_INTERFACE),
+                      profile=(False, None), rcvbuf=INGEST_RCVBUF_BYTES):
+    """
+    Entry point of one sharded ingest worker process. send_options is
+    (queue depth, policy, lanes) for its outbound queues; multicast is
+    (group, interface) for multicast egress; profile is (--profile,
+    --profile-stacks path or None); rcvbuf is --rcvbuf in bytes.
+    """
+    global HOST, ESP32_PORT, HISTORY_SECONDS, POD_TIMEOUT, routing_table
+    global track_pod_liveness, routes_from_main, SEND_QUEUE_DEPTH, SEND_POLICY
+    global MULTICAST_GROUP, MULTICAST_INTERFACE, INGEST_RCVBUF_BYTES, state_lock
+    HOST, ESP32_PORT = host, port
+    INGEST_RCVBUF_BYTES = rcvbuf
+    track_pod_liveness = False  # the main process tracks merged pods
+    routes_from_main = True
+    state_lock = new_timed_lock("state")  # forked while the main process held it
+    HISTORY_SECONDS = history_seconds
+    POD_TIMEOUT = pod_timeout
+    SEND_QUEUE_DEPTH, SEND_POLICY, senders = send_options
+    MULTICAST_GROUP, MULTICAST_INTERFACE = multicast
+    routing_table = route_conn.recv()  # initial snapshot
+    if log_prefix:
+        open_data_log(log_prefix)
+    if capture_path:
+        open_capture(capture_path)
+    profiling, stacks_path = profile
+    if profiling:
+        start_profiling(stacks_path)
+    if log_prefix or capture_path or stacks_path:
+        # The main process terminates its workers on exit; unwind so
+        # the log, capture and stacks get their last writes
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    threading.Thread(target=_worker_route_listener,
+                     args=(route_conn,), daemon=True).start()
+    threading.Thread(target=_worker_status_reporter,
+                     args=(status_queue, WORKER_STATUS_INTERVAL),
+                     daemon=True).start()
+    open_send_lanes(senders)
+    if MULTICAST_GROUP:
+        configure_multicast_egress()
+    start_sender_threads()
+    socks = enable_egress_errors()
+    if socks:
+        # Unreachable clients are evicted by the main process
+        threading.Thread(target=egress_error_loop,
+                         args=(lambda keys: status_queue.put(("unreachable", keys)),
+                               socks),
+                         daemon=True).start()
+    start_coalesce_flusher()
+    try:
+        batched_ingest_loop(open_esp32_socket(reuse_port=True))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_worker_outputs()
+
+
+# Worker pid -> ({(ip, port): send queue depth}, {lock name: (waits,
+# wait seconds)}) from its latest report
+worker_egress = {}
+
+
+def merge_worker_status_loop(status_queue):
+    """
+    Main-process side: fold worker reports into pod_status so the
+    dashboard, /list and /latency see every pod regardless of which
+    worker received it, add up the workers' send counters (queue depths
+    and lock waits are kept per worker for /metrics), and evict clients
+    the workers found unreachable.
+    """
+    while True:
+        report = status_queue.get()
+        if isinstance(report, tuple):
+            kind, payload = report
+            if kind == "unreachable":  # [(ip, port), ...]
+                handle_unreachable(payload)
+            elif kind == "profile":  # see _worker_status_reporter()
+                if profile_stages is None:
+                    continue  # not started yet (see __main__)
+                for stage, (delta, max_ns) in payload.items():
+                    getattr(profile_stages, stage).merge(delta, max_ns)
+            else:  # "send_stats", see _worker_status_reporter()
+                pid, stats, depths, waits = payload
+                for key, (sent, drops, errors) in stats.items():
+                    if key in clients or key[0] == MULTICAST_GROUP:
+                        client_sent[key] += sent
+                        if drops:
+                            send_drops[key] += drops
+                        if errors:
+                            send_errors[key] += errors
+                worker_egress[pid] = (depths, waits)
+            continue
+        for name, (last_seen, last_data, new, sent, (fanout, jitter)) in report.items():
+            state = pod_status.get(name)
+            if state is None:
+                # History stays in the worker that owns the pod
+                state = add_pod(name, last_seen, keep_history=False)
+                if state is None:
+                    continue
+            state.latency.fanout.merge(*fanout)
+            state.latency.jitter.merge(*jitter)
+            if last_seen >= state.last_seen:
+                state.last_seen = last_seen
+                state.last_data = last_data
+            state.count += new
+            state.sent += sent
+            if name not in live_pods:
+                mark_pod_up(name, last_seen)
+
+
+def start_sharded_ingest(num_workers, log_prefix=None, capture_path=None,
+                         profile=(False, None)):
+    """
+    Launch `num_workers` ingest worker processes sharing the ESP32 port.
+    With log_prefix, worker i logs to LOG_PREFIX.wI.NNNN.cbl; with
+    capture_path, it captures to CAPTURE_PATH.wI. profile is
+    (--profile, --profile-stacks PATH): worker i writes its sampled
+    stacks to PATH.wI.
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        sys.exit("--workers needs SO_REUSEPORT, which this OS lacks.")
+
+    status_queue = multiprocessing.Queue()
+    with state_lock:
+        for i in range(num_workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            multiprocessing.Process(
+                target=run_ingest_worker,
+                args=(HOST, ESP32_PORT, HISTORY_SECONDS, POD_TIMEOUT,
+                      child_conn, status_queue,
+                      f"{log_prefix}.w{i}" if log_prefix else None,
+                      f"{capture_path}.w{i}" if capture_path else None,
+                      (SEND_QUEUE_DEPTH, SEND_POLICY, SENDER_LANES),
+                      (MULTICAST_GROUP, MULTICAST_INTERFACE),
+                      (profile[0], f"{profile[1]}.w{i}" if profile[1] else None),
+                      INGEST_RCVBUF_BYTES),
+                daemon=True
+            ).start()
+            parent_conn.send(routing_table)
+            worker_route_conns.append(parent_conn)
+
+    threading.Thread(target=merge_worker_status_loop,
+                     args=(status_queue,), daemon=True).start()
+    print(f"Listening for ESP32 OSC data on port {ESP32_PORT} "
+          f"({num_workers} SO_REUSEPORT workers)...")
+
+
+# ---------------------------------------------------------
+#  ASYNCIO ENGINE (--engine asyncio)
+#  Pod ingest, client control and the dashboard share one
+#  event loop: no OS threads, no socketserver, same wire
+#  protocol and the same handlers as the thread engine.
+# ---------------------------------------------------------
+
+class PodIngestProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram protocol for the ESP32 data port.
+    """
+
+    def datagram_received(self, data, addr):
+        try:
+            handle_pod_datagram(data)
+        except Exception as e:
+            warn_ingest_error(data, e)
+
+    def error_received(self, exc):
+        pass  # e.g. ICMP errors reported on the socket
+
+
+async def status_display_task(refresh_interval=0.5):
+    dashboard = StatusDashboard()
+    while True:
+        dashboard.draw()
+        await asyncio.sleep(refresh_interval)
+
+
+async def liveness_task(interval=LIVENESS_INTERVAL):
+    next_pass = time.time() + interval
+    while True:
+        next_pass, delay = liveness_step(next_pass, interval)
+        await asyncio.sleep(delay)
+
+
+async def handle_metrics_request(reader, writer):
+    """
+    GET /metrics for the asyncio engine (HTTP/1.0, one request per
+    connection).
+    """
+    try:
+        request = (await reader.readline()).split()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass  # headers
+        if len(request) >= 2 and request[0] == b"GET" \
+                and request[1].split(b"?")[0] == b"/metrics":
+            status, content_type = "200 OK", METRICS_CONTENT_TYPE
+            body = render_metrics().encode()
+        else:
+            status, content_type = "404 Not Found", "text/plain"
+            body = b"Not found\n"
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run_asyncio_broker(show_dashboard=True, metrics=None):
+    global coalesce_wake, send_wake
+    loop = asyncio.get_running_loop()
+
+    # Bundle windows close via loop callbacks instead of a thread
+    coalesce_wake = lambda deadline: loop.call_at(deadline, flush_due_bundles)
+
+    # Send lanes drain from writer callbacks while they have a backlog
+    open_send_lanes(SENDER_LANES)
+    if MULTICAST_GROUP:
+        configure_multicast_egress()
+
+    def drain_lane(lane):
+        if drain_send_lane(lane):
+            loop.remove_writer(lane.sock.fileno())
+
+    send_wake = lambda lane: loop.add_writer(lane.sock.fileno(), drain_lane, lane)
+
+    # Liveness: ICMP errors wake the loop like any other readable socket
+    for sock in enable_egress_errors():
+        loop.add_reader(sock.fileno(),
+                        lambda sock=sock: handle_unreachable(drain_egress_errors(sock)))
+    # The loop only keeps weak references to tasks: hold this one until
+    # shutdown
+    liveness = loop.create_task(liveness_task())
+    try:
+        await loop.create_datagram_endpoint(PodIngestProtocol,
+                                            sock=open_esp32_socket())
+        print(f"Listening for ESP32 OSC data on port {ESP32_PORT} (asyncio)...")
+
+        control_srv = osc_server.AsyncIOOSCUDPServer(
+            (HOST, BROKER_OSC_PORT), make_control_dispatcher(), loop)
+        await control_srv.create_serve_endpoint()
+        print(f"Listening for client control on OSC port {BROKER_OSC_PORT}...")
+
+        if metrics is not None:
+            await asyncio.start_server(handle_metrics_request, *metrics)
+            print(f"Serving metrics on http://{metrics[0]}:{metrics[1]}/metrics")
+
+        if show_dashboard:
+            await status_display_task()
+        else:
+            await asyncio.Event().wait()  # serve forever
+    finally:
+        liveness.cancel()
+
+
+# ---------------------------------------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CAFFEINE OSC broker")
+    parser.add_argument(
+        "--engine", choices=ENGINES, default="threads",
+        help="'threads' runs ingest, control and dashboard on OS threads; "
+             "'asyncio' runs them all on one event loop (default: threads)")
+    parser.add_argument(
+        "--ingest-mode", choices=INGEST_MODES, default="batched",
+        help="ESP32 ingest for the thread engine: 'batched' drains many "
+             "datagrams per wakeup on one thread; 'threaded' is the "
+             "original thread-per-packet server (default: batched)")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of ESP32 ingest worker processes sharing the data "
+             "port via SO_REUSEPORT (thread engine; default: 1, no "
+             "extra processes)")
+    parser.add_argument(
+        "--no-dashboard", action="store_true",
+        help="headless mode: don't render the status dashboard")
+    parser.add_argument(
+        "--history-seconds", type=float, default=HISTORY_SECONDS,
+        help="seconds of per-pod history kept for /history; 0 disables "
+             f"(default: {HISTORY_SECONDS:g}, needs NumPy)")
+    parser.add_argument(
+        "--log", metavar="PREFIX",
+        help="log every pod message to PREFIX.NNNN.cbl (with --workers: "
+             "PREFIX.wI.NNNN.cbl per worker); convert to CSV with "
+             "caffeine_binlog.py (needs NumPy)")
+    parser.add_argument(
+        "--capture", metavar="PATH",
+        help="record raw ESP32 datagrams with arrival times to PATH "
+             "(with --workers: PATH.wI per worker) for replay with "
+             "utilities/benchmarks/replay_capture.py")
+    parser.add_argument(
+        "--rcvbuf", type=int, default=INGEST_RCVBUF_BYTES // 1024, metavar="KB",
+        help="kernel receive buffer of the ESP32 data port, in KiB, for "
+             "batched and asyncio ingest: how much a burst can queue "
+             "before datagrams are dropped, and so how much latency an "
+             "overloaded broker adds; 0 keeps the OS default "
+             f"(default: {INGEST_RCVBUF_BYTES // 1024})")
+    parser.add_argument(
+        "--client-timeout", type=float, default=CLIENT_TIMEOUT,
+        help="evict clients that send no control message (e.g. /heartbeat) "
+             "for this many seconds; 0 disables (default: 0). Clients whose "
+             "port is unreachable are evicted either way (Linux)")
+    parser.add_argument(
+        "--pod-timeout", type=float, default=POD_TIMEOUT,
+        help="forget pods (status, history, latency) silent for this many "
+             f"seconds; 0 keeps them forever (default: {POD_TIMEOUT:g})")
+    parser.add_argument(
+        "--send-queue", type=int, default=SEND_QUEUE_DEPTH,
+        help="messages held per client while sends to it back up "
+             f"(default: {SEND_QUEUE_DEPTH})")
+    parser.add_argument(
+        "--send-policy", choices=SEND_POLICIES, default=SEND_POLICY,
+        help="what a full send queue drops: 'drop-oldest' the oldest "
+             "message, 'latest' also keeps at most the newest message "
+             f"per pod (default: {SEND_POLICY})")
+    parser.add_argument(
+        "--senders", type=int, default=SENDER_LANES,
+        help="send lanes draining the queues, each with its own socket "
+             f"(per process with --workers; default: {SENDER_LANES})")
+    parser.add_argument(
+        "--multicast-group", metavar="GROUP",
+        help="IPv4 multicast group for /connect ... \"multicast\" streams, "
+             "e.g. 239.255.67.1 (default: none; such clients get unicast)")
+    parser.add_argument(
+        "--multicast-port", type=int, default=MULTICAST_PORT,
+        help="first UDP port for multicast streams, one port per stream "
+             f"(default: {MULTICAST_PORT})")
+    parser.add_argument(
+        "--multicast-if", metavar="IP",
+        help="local address to send multicast from, e.g. 127.0.0.1 to "
+             "test on loopback (default: per the routing table)")
+    parser.add_argument(
+        "--metrics-port", type=int,
+        help="serve Prometheus metrics at http://HOST:PORT/metrics "
+             "(default: off)")
+    parser.add_argument(
+        "--metrics-host", default="127.0.0.1",
+        help="address for --metrics-port (default: 127.0.0.1, local only)")
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="time each stage of the pod data path (parse, decode, state, "
+             "route, send, log) and print the table on shutdown; also on "
+             "the dashboard and /metrics")
+    parser.add_argument(
+        "--profile-stacks", metavar="PATH",
+        help="with --profile, sample every thread's stack every "
+             f"{PROFILE_SAMPLE_INTERVAL * 1000:g} ms and write them to PATH "
+             "on shutdown as folded stacks for flame graph tools (with "
+             "--workers: PATH.wI per worker)")
+    args = parser.parse_args(argv)
+    if args.multicast_group is not None:
+        try:
+            first_octet = socket.inet_aton(args.multicast_group)[0]
+        except OSError:
+            first_octet = None
+        if first_octet is None or not 224 <= first_octet <= 239:
+            parser.error(f"--multicast-group {args.multicast_group} is not "
+                         f"an IPv4 multicast address")
+    if args.rcvbuf < 0:
+        parser.error("--rcvbuf must be at least 0")
+    if args.send_queue < 1 or args.senders < 1:
+        parser.error("--send-queue and --senders must be at least 1")
+    if args.profile_stacks and not args.profile:
+        parser.error("--profile-stacks needs --profile")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and args.engine != "threads":
+        parser.error("--workers needs --engine threads")
+    if args.capture and args.engine == "threads" and args.workers == 1 \
+            and args.ingest_mode == "threaded":
+        parser.error("--capture needs --ingest-mode batched")
+    return args
+
 
 if __name__ == "__main__":
-    # Start ESP32 listener
-    threading.Thread(
-        target=start_osc_esp32_server,
-        daemon=True
-    ).start()
+    args = parse_args()
+
+    HISTORY_SECONDS = args.history_seconds
+    CLIENT_TIMEOUT = max(0.0, args.client_timeout)
+    POD_TIMEOUT = max(0.0, args.pod_timeout)
+    INGEST_RCVBUF_BYTES = args.rcvbuf * 1024
+    SEND_QUEUE_DEPTH = args.send_queue
+    SEND_POLICY = args.send_policy
+    SENDER_LANES = args.senders
+    MULTICAST_GROUP = args.multicast_group
+    MULTICAST_PORT = args.multicast_port
+    MULTICAST_INTERFACE = args.multicast_if
+    if HISTORY_SECONDS > 0 and np is None:
+        print("NumPy not installed: /history disabled.", file=sys.stderr)
+
+    if args.engine == "asyncio":
+        if args.profile:
+            start_profiling(args.profile_stacks)
+        if args.log:
+            open_data_log(args.log)
+        if args.capture:
+            open_capture(args.capture)
+        try:
+            metrics = None
+            if args.metrics_port is not None:
+                metrics = (args.metrics_host, args.metrics_port)
+            asyncio.run(run_asyncio_broker(not args.no_dashboard, metrics))
+        except KeyboardInterrupt:
+            print("\nShutting down CAFFEINE OSC Broker. Goodbye.")
+        finally:
+            close_data_log()
+            close_capture()
+            stop_profiling()
+        sys.exit(0)
+
+    # Start ESP32 listener (worker processes first, before any threads)
+    if args.workers > 1:
+        start_sharded_ingest(args.workers, args.log, args.capture,
+                             (args.profile, args.profile_stacks))
+    else:
+        if args.log:
+            open_data_log(args.log)
+        if args.capture:
+            open_capture(args.capture)
+        open_send_lanes(SENDER_LANES)
+        if MULTICAST_GROUP:
+            configure_multicast_egress()
+        start_sender_threads()
+        start_coalesce_flusher()
+        threading.Thread(
+            target=start_osc_esp32_server,
+            args=(args.ingest_mode,),
+            daemon=True
+        ).start()
+
+    if args.profile:
+        # With --workers, the main process merges the workers' stage
+        # timings and samples its own threads
+        start_profiling(args.profile_stacks)
+    start_liveness_threads()
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_host, args.metrics_port)
 
     # Start status display dashboard
-    threading.Thread(
-        target=status_display_loop,
-        daemon=True
-    ).start()
+    if not args.no_dashboard:
+        threading.Thread(
+            target=status_display_loop,
+            daemon=True
+        ).start()
 
     # Run client control server in main thread
     try:
         start_osc_registration_server()
     except KeyboardInterrupt:
         print("\nShutting down CAFFEINE OSC Broker. Goodbye.")
+    finally:
+        close_data_log()
+        close_capture()
+        stop_profiling()
@@ -0,0 +1,347 @@
+#---------------------------------------------------------
+# CAFFEINE BINARY LOGGER
+#   - Low-overhead measurement logging for the broker and
+#     the test suite: the OSC handler only appends a tuple
+#     to a queue; a background thread packs records into
+#     preallocated NumPy column buffers and writes them as
+#     columnar chunks
+#   - Files: PREFIX.0000.cbl, PREFIX.0001.cbl, ... (a new
+#     file every `rotate_rows` rows)
+#   - Converter back to the CSV layout used in paper/logs:
+#       python caffeine_binlog.py broker_log
+#       python caffeine_binlog.py endpoint_log_pod1 -o pod1.csv
+#
+#   File layout: b"CAFBLOG1", then chunks of
+#       uint32 (big-endian) header length
+#       JSON header {"rows", "columns", "strings"}
+#       one little-endian array per column, in column order
+#   Each chunk carries its own string tables, so any chunk
+#   (and any rotated file) can be read on its own.
+#---------------------------------------------------------
+
+import argparse
+import collections
+import csv
+import glob
+import json
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b"CAFBLOG1"
+FILE_SUFFIX = ".cbl"
+
+# Column kinds besides plain NumPy dtypes ("f8", "i8", "f4", ...):
+#   "time"  float64 epoch seconds, written to CSV as local ISO time
+#           (datetime.now().isoformat() in the original loggers)
+#   "str"   short repeated strings (pod names), stored as int32 codes
+#           into a per-chunk string table
+TIME = "time"
+STR = "str"
+
+# Record layouts of the test-suite CSV logs. A third item is the number
+# of decimals the CSV rounds that column to.
+BROKER_TEST_COLUMNS = [
+    ("system_time", TIME),
+    ("pod", STR),
+    ("remote_timestamp", "f8"),
+    ("latency_ms", "f8", 3),
+    ("sequence_number", "i8"),
+    ("dropped_in_interval", "i8"),
+    ("dropped_total", "i8"),
+    ("loss_percent", "f8", 3),
+]
+
+ENDPOINT_COLUMNS = [
+    ("system_time", TIME),
+    ("remote_timestamp", "f8"),
+    ("latency_ms", "f8", 3),
+    ("sequence_number", "i8"),
+]
+
+# broker_osc.py --log: one row per pod message received
+BROKER_COLUMNS = [
+    ("system_time", TIME),
+    ("pod", STR),
+    ("x", "f4"), ("y", "f4"), ("z", "f4"),
+    ("sound", "i4"),
+    ("distance", "f4"),
+    ("light", "i4"),
+    ("sent", "i4"),
+]
+
+
+def _storage_dtype(kind):
+    if kind == TIME:
+        return np.dtype("<f8")
+    if kind == STR:
+        return np.dtype("<i4")
+    return np.dtype(kind).newbyteorder("<")
+
+
+class BinaryLogger:
+    """
+    Queue records from a latency-sensitive thread and write them in
+    the background. log(record) is a bare deque append; record is a
+    tuple of values in `columns` order. Records that don't fit the
+    columns (wrong length, or values the dtypes can't hold) are skipped
+    and counted in bad_records. Call close() (or use as a context
+    manager) to write the last chunk.
+    """
+
+    def __init__(self, prefix, columns, chunk_rows=4096,
+                 rotate_rows=1_000_000, flush_interval=1.0):
+        self.prefix = prefix
+        self.columns = [tuple(c) for c in columns]
+        self.names = [c[0] for c in self.columns]
+        self.kinds = [c[1] for c in self.columns]
+        self.dtypes = [_storage_dtype(k) for k in self.kinds]
+        self.chunk_rows = chunk_rows
+        self.rotate_rows = rotate_rows
+        self.flush_interval = flush_interval
+
+        self.buffers = [np.zeros(chunk_rows, dtype=dt) for dt in self.dtypes]
+        self.filled = 0
+        self.string_codes = {i: {} for i, k in enumerate(self.kinds) if k == STR}
+
+        self.file = None
+        self.file_index = 0
+        self.file_rows = 0
+        self.rows_written = 0
+        self.bad_records = 0
+
+        self.pending = collections.deque()
+        self.log = self.pending.append  # thread-safe, no lock
+        self.wake = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+
+    # --- writer thread ---
+
+    def _run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self._drain()
+            if self.filled:
+                self._write_chunk()
+        self._drain()
+        if self.filled:
+            self._write_chunk()
+        if self.file is not None:
+            self.file.close()
+
+    def _drain(self):
+        popleft = self.pending.popleft
+        while self.pending:
+            n = min(len(self.pending), self.chunk_rows - self.filled)
+            batch = [popleft() for _ in range(n)]
+            self._pack(batch)
+            if self.filled == self.chunk_rows:
+                self._write_chunk()
+
+    def _pack(self, batch):
+        # One bad record must not end the writer thread: retry the
+        # batch record by record and skip the ones that fail
+        try:
+            self._pack_rows(batch)
+        except (TypeError, ValueError, OverflowError):
+            for record in batch:
+                try:
+                    self._pack_rows((record,))
+                except (TypeError, ValueError, OverflowError):
+                    self.bad_records += 1
+
+    def _pack_rows(self, batch):
+        width = len(self.columns)
+        if any(len(record) != width for record in batch):
+            raise ValueError("record length doesn't match the columns")
+        start, end = self.filled, self.filled + len(batch)
+        for i, column in enumerate(zip(*batch)):
+            codes = self.string_codes.get(i)
+            if codes is not None:
+                column = [codes.setdefault(v, len(codes)) for v in column]
+            self.buffers[i][start:end] = column
+        self.filled = end
+
+    def _write_chunk(self):
+        # Split the chunk where a file reaches rotate_rows, so every
+        # file but the last holds exactly rotate_rows rows
+        start = 0
+        while start < self.filled:
+            if self.file is None or self.file_rows >= self.rotate_rows:
+                self._rotate()
+            n = min(self.filled - start, self.rotate_rows - self.file_rows)
+            header = json.dumps({
+                "rows": n,
+                "columns": [list(c) for c in self.columns],
+                "strings": {self.names[i]: list(codes)
+                            for i, codes in self.string_codes.items()},
+            }).encode()
+            self.file.write(struct.pack(">I", len(header)))
+            self.file.write(header)
+            for buf in self.buffers:
+                self.file.write(buf[start:start + n].tobytes())
+            self.file.flush()
+            self.file_rows += n
+            self.rows_written += n
+            start += n
+        self.filled = 0
+
+    def _rotate(self):
+        if self.file is not None:
+            self.file.close()
+        path = f"{self.prefix}.{self.file_index:04d}{FILE_SUFFIX}"
+        self.file_index += 1
+        self.file_rows = 0
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+
+
+# ---------------------------------------------------------
+#  READING / CSV CONVERSION
+# ---------------------------------------------------------
+
+def iter_chunks(path):
+    """
+    Yield (columns, {name: array}) for each chunk in one .cbl file.
+    String columns are returned as object arrays of str.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a CAFFEINE binary log")
+        while True:
+            size = f.read(4)
+            if len(size) < 4:
+                return
+            size = struct.unpack(">I", size)[0]
+            raw = f.read(size)
+            if len(raw) < size:
+                return
+            header = json.loads(raw)
+            rows = header["rows"]
+            data = {}
+            for column in header["columns"]:
+                name, kind = column[0], column[1]
+                dtype = _storage_dtype(kind)
+                raw = f.read(rows * dtype.itemsize)
+                if len(raw) < rows * dtype.itemsize:
+                    return  # truncated last chunk (logger killed mid-write)
+                values = np.frombuffer(raw, dtype=dtype)
+                if kind == STR:
+                    table = np.array(header["strings"][name], dtype=object)
+                    values = table[values]
+                data[name] = values
+            yield header["columns"], data
+
+
+def log_files(prefix_or_path):
+    if os.path.isfile(prefix_or_path):
+        return [prefix_or_path]
+    return sorted(glob.glob(glob.escape(prefix_or_path) + ".[0-9]*" + FILE_SUFFIX))
+
+
+def read_log(prefix_or_path):
+    """
+    Load every chunk of a log (a .cbl file, or the prefix of a rotated
+    set) into {column name: array}.
+    """
+    parts = collections.defaultdict(list)
+    for path in log_files(prefix_or_path):
+        for _columns, data in iter_chunks(path):
+            for name, values in data.items():
+                parts[name].append(values)
+    return {name: np.concatenate(values) for name, values in parts.items()}
+
+
+def _csv_formatter(column):
+    kind = column[1]
+    digits = column[2] if len(column) > 2 else None
+    if kind == TIME:
+        return lambda v: datetime.fromtimestamp(v).isoformat()
+    if digits is not None:
+        return lambda v: round(float(v), digits)
+    if kind == STR:
+        return str
+    if np.dtype(kind).kind in "iu":
+        return int
+    if np.dtype(kind) == np.float32:
+        return str
+    return float
+
+
+def _csv_values(column, values):
+    # float32 columns: shortest repr of the stored float32 (1.234567,
+    # not 1.2345670461654663)
+    if len(column) == 2 and values.dtype == np.float32:
+        return values.astype(str).tolist()
+    return values.tolist()
+
+
+def write_csv(prefix_or_path, out_path):
+    """
+    Convert a binary log to CSV, one row per record, with the column
+    names as header. Returns the number of rows written.
+    """
+    paths = log_files(prefix_or_path)
+    if not paths:
+        raise FileNotFoundError(f"no {FILE_SUFFIX} files for {prefix_or_path}")
+    rows = 0
+    with open(out_path, "w", newline='') as out:
+        writer = csv.writer(out)
+        header_written = False
+        for path in paths:
+            for columns, data in iter_chunks(path):
+                if not header_written:
+                    writer.writerow([c[0] for c in columns])
+                    header_written = True
+                formats = [_csv_formatter(c) for c in columns]
+                arrays = [_csv_values(c, data[c[0]]) for c in columns]
+                for record in zip(*arrays):
+                    writer.writerow([fmt(v) for fmt, v in zip(formats, record)])
+                rows += len(arrays[0]) if arrays else 0
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert CAFFEINE binary logs (.cbl) to CSV")
+    parser.add_argument("logs", nargs="+",
+                        help="log prefix (e.g. broker_log) or .cbl file")
+    parser.add_argument("-o", "--output",
+                        help="CSV path (default: PREFIX.csv; only with one log)")
+    args = parser.parse_args()
+    if args.output and len(args.logs) > 1:
+        parser.error("-o needs a single log")
+
+    for log in args.logs:
+        stem = log[:-len(FILE_SUFFIX)] if log.endswith(FILE_SUFFIX) else log
+        out_path = args.output or stem + ".csv"
+        t0 = time.time()
+        try:
+            rows = write_csv(log, out_path)
+        except (OSError, ValueError) as e:
+            print(f"{log}: {e}")
+            continue
+        print(f"{log} -> {out_path}: {rows} rows ({time.time() - t0:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#---------------------------------------------------------
+# CAFFEINE POD TRAFFIC CAPTURE
+#   - Raw ESP32 datagrams as received on the broker's data
+#     port (5001), with arrival timestamps, for replay
+#     without hardware (utilities/benchmarks/replay_capture.py)
+#   - Written by broker_osc.py --capture PATH
+#
+#   File layout: b"CAFCAP01", float64 start time (epoch s),
+#   then one record per datagram:
+#       float64  arrival time, seconds since start
+#       uint16   datagram length
+#       bytes    the datagram, unchanged
+#   All numbers little-endian. A pod message costs 10 bytes
+#   of overhead (~66 bytes per record for the firmware's
+#   six values).
+#---------------------------------------------------------
+
+import struct
+import time
+
+MAGIC = b"CAFCAP01"
+_START = struct.Struct("<d")
+_RECORD = struct.Struct("<dH")
+
+
+class CaptureWriter:
+    """
+    Append datagrams to a capture file. write() is called from the
+    ingest thread (one writer per thread/process) and only packs into
+    a large buffered file, so it adds well under a microsecond.
+    """
+
+    def __init__(self, path, buffer_size=1 << 20):
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.start = time.time()
+        self.file.write(MAGIC + _START.pack(self.start))
+        self.count = 0
+
+    def write(self, data, arrival=None):
+        if arrival is None:
+            arrival = time.time()
+        self.file.write(_RECORD.pack(arrival - self.start, len(data)))
+        self.file.write(data)
+        self.count += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_capture(path):
+    """
+    Return (start_time, [(t, datagram), ...]) with t in seconds since
+    start. A record cut short at the end (broker killed mid-write) is
+    dropped.
+    """
+    with open(path, "rb") as f:
+        blob = f.read()
+    if blob[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a CAFFEINE pod capture")
+    offset = len(MAGIC)
+    (start,) = _START.unpack_from(blob, offset)
+    offset += _START.size
+    records = []
+    end = len(blob)
+    while offset + _RECORD.size <= end:
+        t, n = _RECORD.unpack_from(blob, offset)
+        offset += _RECORD.size
+        if offset + n > end:
+            break
+        records.append((t, blob[offset:offset + n]))
+        offset += n
+    return start, records
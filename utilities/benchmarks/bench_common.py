@@ -0,0 +1,55 @@
+#---------------------------------------------------------
+# CAFFEINE BENCHMARK HELPERS
+#   - Shared by the scripts in this folder
+#   - Pod messages match the firmware payload
+#       /podN, x(f), y(f), z(f), sound(i), distance(f), light(i)
+#     with a sequence number in `sound` and the send time
+#     (monotonic microseconds) in `light`, so latency can
+#     be measured on one host without clock sync
+#---------------------------------------------------------
+
+import os
+import struct
+import sys
+import time
+
+OSC_PROGRAMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "osc_programs")
+BROKER_SCRIPT = os.path.join(OSC_PROGRAMS_DIR, "broker_osc.py")
+
+if OSC_PROGRAMS_DIR not in sys.path:
+    sys.path.insert(0, OSC_PROGRAMS_DIR)
+
+US_MASK = 0x7FFFFFFF
+
+
+def now_us():
+    return (time.monotonic_ns() // 1000) & US_MASK
+
+
+def elapsed_us(sent_us):
+    return (now_us() - sent_us) & US_MASK
+
+
+def _osc_string(s):
+    b = s.encode() + b"\0"
+    return b + b"\0" * (-len(b) % 4)
+
+
+_POD_TYPETAGS = _osc_string(",fffifi")
+
+
+def encode_pod_message(pod_name, seq, sent_us):
+    """
+    Build the same OSC message the firmware sends, with seq in `sound`
+    and the send time in `light`.
+    """
+    return (_osc_string(pod_name) + _POD_TYPETAGS
+            + struct.pack(">fffifi", 12.34, -5.67, 89.01, seq, 42.0, sent_us))
+
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return float("nan")
+    idx = min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
@@ -0,0 +1,172 @@
+#---------------------------------------------------------
+# CAFFEINE BROKER INGEST BENCHMARK
+#   - Compares the broker's ESP32 ingest engines
+#     (--ingest-mode batched vs threaded, and the
+#     --engine asyncio datagram protocol) over loopback
+#   - A sender process plays N pods, each sending the
+#     firmware's six-value payload (x, y, z, sound,
+#     distance, light)
+#   - The send time (monotonic, microseconds) rides in
+#     the integer "light" slot, so the receiver can
+#     measure ingest latency without clock sync
+#   - Reports sustained packets/s and p50/p99 latency
+#
+#   Usage:
+#     python ingest_bench.py                 (both modes)
+#     python ingest_bench.py --pods 30 --rate 100
+#     python ingest_bench.py --rate 0        (flood)
+#---------------------------------------------------------
+
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import socket
+import threading
+import time
+
+from bench_common import US_MASK, encode_pod_message, now_us, percentile
+import broker_osc
+
+MODES = broker_osc.INGEST_MODES + ("asyncio",)
+
+
+# ---------------------------------------------------------
+#  RECEIVER (runs the broker's ingest engine)
+# ---------------------------------------------------------
+
+def _run_receiver(mode, port, rcvbuf, conn):
+    latencies = []
+    record = latencies.append
+
+    def recording_ingest(address, args, raw=None):
+        if args is None:  # passthrough: only the address has been read
+            args = broker_osc.decode_osc_values(raw)
+        record((now_us() - args[5]) & US_MASK)
+
+    # Replace the broker's per-message step, which every ingest engine
+    # calls (see ingest_pod_message()), so only ingest is measured
+    broker_osc.ingest_pod_message = recording_ingest
+    broker_osc.HOST = "127.0.0.1"
+    broker_osc.ESP32_PORT = port
+    broker_osc.INGEST_RCVBUF_BYTES = rcvbuf
+
+    if mode == "asyncio":
+        async def serve():
+            loop = asyncio.get_running_loop()
+            await loop.create_datagram_endpoint(
+                broker_osc.PodIngestProtocol, sock=broker_osc.open_esp32_socket())
+            await asyncio.Event().wait()
+        target, target_args = asyncio.run, (serve(),)
+    else:
+        target, target_args = broker_osc.start_osc_esp32_server, (mode,)
+    threading.Thread(target=target, args=target_args, daemon=True).start()
+    conn.send("ready")
+    conn.recv()  # "start"
+    del latencies[:]
+    conn.recv()  # "stop"
+    conn.send(list(latencies))
+
+
+# ---------------------------------------------------------
+#  SENDER (plays N pods)
+# ---------------------------------------------------------
+
+def _run_sender(port, pods, rate, duration, conn):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    dest = ("127.0.0.1", port)
+    names = [f"/pod{i + 1}" for i in range(pods)]
+    sent = 0
+    seq = 0
+    t_end = time.monotonic() + duration
+    if rate > 0:
+        period = 1.0 / rate
+        next_tick = time.monotonic()
+        while next_tick < t_end:
+            for name in names:
+                sock.sendto(encode_pod_message(name, seq, now_us()), dest)
+            sent += pods
+            seq += 1
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    else:
+        while time.monotonic() < t_end:
+            for name in names:
+                try:
+                    sock.sendto(encode_pod_message(name, seq, now_us()), dest)
+                    sent += 1
+                except OSError:
+                    pass
+            seq += 1
+    conn.send(sent)
+
+
+def run_mode(mode, port, pods, rate, duration, rcvbuf=broker_osc.INGEST_RCVBUF_BYTES):
+    ctx = mp.get_context("fork") if hasattr(os, "fork") else mp
+    recv_conn, recv_child = ctx.Pipe()
+    receiver = ctx.Process(target=_run_receiver,
+                           args=(mode, port, rcvbuf, recv_child), daemon=True)
+    receiver.start()
+    recv_conn.recv()  # "ready"
+    time.sleep(0.2)
+
+    send_conn, send_child = ctx.Pipe()
+    recv_conn.send("start")
+    sender = ctx.Process(target=_run_sender,
+                         args=(port, pods, rate, duration, send_child),
+                         daemon=True)
+    sender.start()
+    sent = send_conn.recv()
+    sender.join()
+    time.sleep(0.5)  # let the tail drain
+    recv_conn.send("stop")
+    latencies = recv_conn.recv()
+    receiver.terminate()
+    receiver.join()
+
+    latencies.sort()
+    received = len(latencies)
+    return {
+        "mode": mode,
+        "sent": sent,
+        "received": received,
+        "loss_pct": 100.0 * (sent - received) / sent if sent else 0.0,
+        "pps": received / duration,
+        "p50_ms": percentile(latencies, 0.50) / 1000.0,
+        "p99_ms": percentile(latencies, 0.99) / 1000.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the broker's ESP32 ingest engines")
+    parser.add_argument("--modes", nargs="+", default=list(MODES),
+                        choices=MODES)
+    parser.add_argument("--pods", type=int, default=30)
+    parser.add_argument("--rate", type=float, default=100.0,
+                        help="messages/s per pod; 0 = as fast as possible")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=15001)
+    parser.add_argument("--rcvbuf", type=int, metavar="KB",
+                        default=broker_osc.INGEST_RCVBUF_BYTES // 1024,
+                        help="receive buffer, as the broker's --rcvbuf "
+                             "(batched and asyncio; 0 = OS default)")
+    args = parser.parse_args()
+
+    offered = "flood" if args.rate <= 0 else f"{args.pods * args.rate:.0f} pkt/s"
+    print(f"{args.pods} pods, offered load {offered}, {args.duration:.0f} s per mode\n")
+    print(f"{'Mode':<10} {'Sent':>9} {'Received':>9} {'Loss %':>7} "
+          f"{'pkt/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    print("-" * 66)
+    for i, mode in enumerate(args.modes):
+        r = run_mode(mode, args.port + i, args.pods, args.rate, args.duration,
+                     args.rcvbuf * 1024)
+        print(f"{r['mode']:<10} {r['sent']:>9} {r['received']:>9} "
+              f"{r['loss_pct']:>7.2f} {r['pps']:>9.0f} "
+              f"{r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
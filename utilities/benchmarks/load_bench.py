@@ -0,0 +1,305 @@
+#---------------------------------------------------------
+# CAFFEINE END-TO-END LOAD BENCHMARK (N pods x M clients)
+#   - Starts a broker, then over loopback:
+#       * a sender process plays N pods, each from its own
+#         UDP socket, sending the firmware's six-value
+#         payload at --rate Hz
+#       * M clients /register and /connect to every pod
+#         with the current protocol (one /connect per pod,
+#         so older brokers can be measured too)
+#   - Reports delivered messages/s, loss, p50/p99 end-to-end
+#     latency and the broker's CPU use for every N x M
+#     combination
+#   - --multicast has the clients /connect with "multicast"
+#     and listen on the announced group and ports (over
+#     loopback), so the broker sends each pod's stream once
+#   - --broker runs another broker_osc.py (e.g. a checkout
+#     of an older version); --json saves the results so
+#     runs can be compared
+#
+#   Usage:
+#     python load_bench.py
+#     python load_bench.py --pods 10 50 --clients 1 8 --rate 100
+#     python load_bench.py --broker /path/to/old/broker_osc.py --json old.json
+#     python load_bench.py --pods 10 --clients 1 4 16 --multicast
+#---------------------------------------------------------
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+from bench_common import (BROKER_SCRIPT, elapsed_us, encode_pod_message,
+                          now_us, percentile)
+from pythonosc import osc_message, osc_message_builder
+
+DATA_ADDR = ("127.0.0.1", 5001)
+CONTROL_ADDR = ("127.0.0.1", 9001)
+MULTICAST_ARGS = ["--multicast-group", "239.255.67.1", "--multicast-if", "127.0.0.1"]
+
+
+def _control(sock, address, args):
+    sock.sendto(osc_message_builder.build_msg(address, args).dgram, CONTROL_ADDR)
+
+
+def _await_reply(sock, tag, timeout=2.0):
+    """
+    Wait for a /broker reply whose first argument is `tag`.
+    """
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        try:
+            data = sock.recv(65535)
+        except socket.timeout:
+            continue
+        if data.startswith(b"/broker"):
+            msg = osc_message.OscMessage(data)
+            if msg.params and msg.params[0] == tag:
+                return True
+    return False
+
+
+def _await_streams(sock, count, timeout=2.0):
+    """
+    Collect (group, port) from `count` /broker, "multicast" replies.
+    """
+    streams = []
+    t_end = time.monotonic() + timeout
+    while len(streams) < count and time.monotonic() < t_end:
+        try:
+            data = sock.recv(65535)
+        except socket.timeout:
+            continue
+        if data.startswith(b"/broker"):
+            params = osc_message.OscMessage(data).params
+            if params and params[0] == "multicast":
+                streams.append((params[2], params[3]))
+    return streams
+
+
+def _join_stream(group, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(("", port))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                    socket.inet_aton(group) + socket.inet_aton("127.0.0.1"))
+    return sock
+
+
+def _process_cpu_s(pid):
+    """
+    CPU seconds (user + system) used by pid and its child processes
+    (sharded brokers), from /proc; None where /proc is unavailable.
+    """
+    tick = os.sysconf("SC_CLK_TCK")
+    total = 0
+    found = False
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else ():
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # fields[1] is the parent pid; utime, stime are fields 11, 12
+        if int(entry) == pid or int(fields[1]) == pid:
+            total += int(fields[11]) + int(fields[12])
+            found = True
+    return total / tick if found else None
+
+
+# ---------------------------------------------------------
+#  PODS (sender process)
+# ---------------------------------------------------------
+
+def _run_pods(names, rate, duration, go, conn):
+    socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in names]
+    go.wait()
+    period = 1.0 / rate
+    sent = 0
+    seq = 0
+    next_tick = time.monotonic()
+    t_end = next_tick + duration
+    while next_tick < t_end:
+        for sock, name in zip(socks, names):
+            try:
+                sock.sendto(encode_pod_message(name, seq, now_us()), DATA_ADDR)
+                sent += 1
+            except OSError:
+                pass
+        seq += 1
+        next_tick += period
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    conn.send(sent)
+
+
+# ---------------------------------------------------------
+#  CLIENTS (receiver process, one socket per client)
+# ---------------------------------------------------------
+
+def _run_clients(names, num_clients, duration, go, conn, multicast=False):
+    socks = []
+    for _ in range(num_clients):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(0.1)
+        socks.append(sock)
+
+    # The broker answers the last client registered per IP, so set up
+    # one client at a time. A multicast client listens on one socket
+    # per announced stream, like a client on another host would.
+    ok = True
+    for sock in list(socks):
+        _control(sock, "/register", [sock.getsockname()[1]])
+        ok &= _await_reply(sock, "registered")
+        for name in names:
+            _control(sock, "/connect", [name, "multicast"] if multicast else [name])
+        if multicast:
+            streams = _await_streams(sock, len(names))
+            ok &= len(streams) == len(names)
+            socks += [_join_stream(group, port) for group, port in streams]
+        time.sleep(0.05)
+        _control(sock, "/list", [])
+        ok &= _await_reply(sock, "pod_list")
+    conn.send(ok)
+
+    sel = selectors.DefaultSelector()
+    for sock in socks:
+        sock.setblocking(False)
+        sel.register(sock, selectors.EVENT_READ)
+
+    latencies = []
+    record = latencies.append
+    go.wait()
+    t_end = time.monotonic() + duration + 0.5  # let the tail drain
+    while True:
+        timeout = t_end - time.monotonic()
+        if timeout <= 0:
+            break
+        for key, _ in sel.select(timeout):
+            sock = key.fileobj
+            while True:
+                try:
+                    data = sock.recv(65535)
+                except (BlockingIOError, InterruptedError):
+                    break
+                if data.startswith(b"/pod"):
+                    record(elapsed_us(osc_message.OscMessage(data).params[5]))
+    conn.send(latencies)
+
+
+def run_load(broker_script, broker_args, pods, clients, rate, duration,
+             multicast=False):
+    if multicast:
+        broker_args = broker_args + MULTICAST_ARGS
+    broker = subprocess.Popen(
+        [sys.executable, broker_script, "--no-dashboard"] + broker_args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(1.0)
+        names = [f"/pod{i + 1}" for i in range(pods)]
+        go = mp.Event()
+        client_conn, client_child = mp.Pipe()
+        pod_conn, pod_child = mp.Pipe()
+        receiver = mp.Process(target=_run_clients,
+                              args=(names, clients, duration, go, client_child,
+                                    multicast),
+                              daemon=True)
+        receiver.start()
+        if not client_conn.recv():
+            print(f"  warning: broker did not confirm every client "
+                  f"({pods} pods x {clients} clients)", file=sys.stderr)
+        sender = mp.Process(target=_run_pods,
+                            args=(names, rate, duration, go, pod_child),
+                            daemon=True)
+        sender.start()
+        time.sleep(0.3)
+        cpu_start = _process_cpu_s(broker.pid)
+        go.set()
+        sent = pod_conn.recv()
+        cpu_end = _process_cpu_s(broker.pid)
+        latencies = client_conn.recv()
+        sender.join()
+        receiver.join()
+    finally:
+        broker.terminate()
+        broker.wait()
+
+    latencies.sort()
+    expected = sent * clients
+    delivered = len(latencies)
+    return {
+        "pods": pods,
+        "clients": clients,
+        "rate_hz": rate,
+        "sent": sent,
+        "expected": expected,
+        "delivered": delivered,
+        "delivered_per_s": delivered / duration,
+        "loss_pct": 100.0 * (expected - delivered) / expected if expected else 0.0,
+        "p50_ms": percentile(latencies, 0.50) / 1000.0,
+        "p99_ms": percentile(latencies, 0.99) / 1000.0,
+        "broker_cpu_pct": (100.0 * (cpu_end - cpu_start) / duration
+                           if cpu_start is not None and cpu_end is not None
+                           else None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end broker load test: N pods x M clients over loopback")
+    parser.add_argument("--pods", type=int, nargs="+", default=[1, 10, 30, 100])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rate", type=float, default=100.0,
+                        help="messages/s per pod (firmware: 100)")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--broker", default=BROKER_SCRIPT,
+                        help="broker script to test (default: this repo's)")
+    parser.add_argument("--broker-args", default="",
+                        help="extra broker arguments, e.g. \"--workers 2\"")
+    parser.add_argument("--multicast", action="store_true",
+                        help="clients receive by multicast on loopback "
+                             "(needs a broker with --multicast-group)")
+    parser.add_argument("--json", metavar="PATH", help="also save results as JSON")
+    args = parser.parse_args()
+
+    print(f"Broker: {os.path.relpath(args.broker)} {args.broker_args}".rstrip()
+          + (" (multicast)" if args.multicast else ""))
+    print(f"{args.rate:g} Hz per pod, {args.duration:g} s per run, "
+          f"{os.cpu_count()} CPUs\n")
+    print(f"{'Pods':>5} {'Clients':>8} {'Expected':>9} {'Delivered':>10} "
+          f"{'msg/s':>8} {'Loss %':>7} {'p50 ms':>8} {'p99 ms':>8} {'CPU %':>6}")
+    print("-" * 77)
+    results = []
+    for pods in args.pods:
+        for clients in args.clients:
+            r = run_load(args.broker, args.broker_args.split(), pods, clients,
+                         args.rate, args.duration, args.multicast)
+            results.append(r)
+            cpu = r["broker_cpu_pct"]
+            print(f"{pods:>5} {clients:>8} {r['expected']:>9} {r['delivered']:>10} "
+                  f"{r['delivered_per_s']:>8.0f} {r['loss_pct']:>7.2f} "
+                  f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                  f"{'-' if cpu is None else format(cpu, '.0f'):>6}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"broker": args.broker, "broker_args": args.broker_args,
+                       "duration": args.duration, "cpus": os.cpu_count(),
+                       "multicast": args.multicast,
+                       "results": results}, f, indent=2)
+        print(f"\nSaved {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#---------------------------------------------------------
+# CAFFEINE BROKER MICRO-BENCHMARKS
+#   - Calls broker_osc.py's hot functions in-process, with
+#     the egress socket replaced by a null sink, at 10,
+#     100 and 1000 pods/clients:
+#       handler     osc_sensor_data_handler(), one subscriber
+#                   per pod, cycling through all pods
+#       record      the same with no subscribers: the per-pod
+#                   bookkeeping alone
+#       ingest      handler through handle_pod_datagram(),
+#                   i.e. including OSC parsing of the datagram
+#       fanout      broadcast_to_pod_clients() for one pod
+#                   with every client subscribed
+#       active      get_active_pods()
+#       dashboard   StatusDashboard.build_lines() snapshot
+#       fullgc      gc.collect() with the broker's state at
+#                   that scale: a full collection's pause
+#   - Reports ns/op (best of several repeats), bytes
+#     allocated per call (tracemalloc peak), and garbage
+#     collector runs and pause time per 10k calls
+#   - --save writes a baseline; --compare fails (exit 1)
+#     when a result regresses past --threshold
+#   - --profile runs the cases with the broker's stage
+#     timers on (--profile), to compare with a baseline
+#
+#   Usage:
+#     python micro_bench.py
+#     python micro_bench.py --save baseline.json
+#     python micro_bench.py --compare baseline.json --threshold 0.25
+#     python micro_bench.py --profile --compare baseline.json
+#---------------------------------------------------------
+
+import argparse
+import gc
+import importlib
+import json
+import sys
+import time
+import tracemalloc
+
+from bench_common import encode_pod_message  # also puts osc_programs on sys.path
+import broker_osc
+
+SCALES = (10, 100, 1000)
+PAYLOAD = (12.3456, -5.6789, 89.0123, 512, 42.5, 300)
+
+# --profile: time the broker's data path stages while benchmarking
+PROFILE = False
+
+
+class NullSocket:
+    """
+    Stand-in for the broker's egress socket: accepts and drops.
+    """
+
+    def sendto(self, data, *flags_address):
+        return len(data)
+
+
+def fresh_broker(pods, clients, fanout_all=False):
+    """
+    Reload broker_osc with `pods` pods that have sent once and `clients`
+    registered clients. Client i subscribes to pod i % pods; with
+    fanout_all every client also subscribes to /pod1.
+    """
+    broker = importlib.reload(broker_osc)
+    broker.egress_sock.close()
+    broker.egress_sock = NullSocket()
+    if PROFILE:
+        broker.start_profiling()
+    names = [f"/pod{i + 1}" for i in range(pods)]
+    for name in names:
+        broker.osc_sensor_data_handler(name, *PAYLOAD)
+    with broker.state_lock:
+        for i in range(clients):
+            key = (f"10.0.{i // 250}.{i % 250 + 1}", 9000)
+            broker.clients[key] = time.time()
+            broker.last_registered_for_ip[key[0]] = key
+            broker.pod_subscriptions[names[i % pods]].add(key)
+            broker.client_subscriptions[key][names[i % pods]] = broker.FULL_SUBSCRIPTION
+            if fanout_all:
+                broker.pod_subscriptions["/pod1"].add(key)
+                broker.client_subscriptions[key]["/pod1"] = broker.FULL_SUBSCRIPTION
+        broker.rebuild_routing_table()
+    return broker, names
+
+
+def make_cases(scale):
+    """
+    Yield (name, zero-argument callable) for one scale.
+    """
+    broker, names = fresh_broker(scale, scale)
+    handler = broker.osc_sensor_data_handler
+    state = {"i": 0}
+
+    def handler_op():
+        i = state["i"]
+        state["i"] = i + 1 if i + 1 < scale else 0
+        handler(names[i], *PAYLOAD)
+    yield "handler", handler_op
+
+    broker, names = fresh_broker(scale, 0)
+    handler = broker.osc_sensor_data_handler
+    state = {"i": 0}
+
+    def record_op():
+        i = state["i"]
+        state["i"] = i + 1 if i + 1 < scale else 0
+        handler(names[i], *PAYLOAD)
+    yield "record", record_op
+
+    broker, names = fresh_broker(scale, scale)
+    handle = broker.handle_pod_datagram
+    dgrams = [encode_pod_message(name, 512, 300) for name in names]
+    state = {"i": 0}
+
+    def ingest_op():
+        i = state["i"]
+        state["i"] = i + 1 if i + 1 < scale else 0
+        handle(dgrams[i])
+    yield "ingest", ingest_op
+
+    broker, _ = fresh_broker(scale, scale, fanout_all=True)
+    data = list(PAYLOAD)
+    yield "fanout", lambda: broker.broadcast_to_pod_clients("/pod1", data)
+
+    broker, _ = fresh_broker(scale, scale)
+    yield "active", broker.get_active_pods
+
+    dashboard = broker.StatusDashboard()
+    yield "dashboard", dashboard.build_lines
+
+    yield "fullgc", gc.collect
+
+
+def time_op(op, repeats=5, target_s=0.1):
+    """
+    Best-of-`repeats` ns per call, with the loop count calibrated so
+    one repeat takes about target_s.
+    """
+    n = 1
+    while True:
+        t0 = time.perf_counter_ns()
+        for _ in range(n):
+            op()
+        dt = time.perf_counter_ns() - t0
+        if dt >= target_s * 1e9 / 10 or n >= 1 << 20:
+            break
+        n *= 4
+    n = max(1, int(n * target_s * 1e9 / max(dt, 1)))
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter_ns()
+        for _ in range(n):
+            op()
+        per_op = (time.perf_counter_ns() - t0) / n
+        best = per_op if best is None else min(best, per_op)
+    return best
+
+
+def alloc_op(op, calls=200):
+    """
+    Mean bytes allocated during one call: the tracemalloc peak above
+    the memory in use before the call.
+    """
+    op()  # warm caches outside the trace
+    tracemalloc.start()
+    total = 0
+    for _ in range(calls):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        op()
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / calls
+
+
+def gc_op(op, calls):
+    """
+    (collections, total pause in us) per 10k calls, from gc.callbacks.
+    """
+    pauses = []
+    started = []
+
+    def callback(phase, info):
+        if phase == "start":
+            started.append(time.perf_counter_ns())
+        elif started:
+            pauses.append(time.perf_counter_ns() - started.pop())
+
+    gc.collect()
+    gc.callbacks.append(callback)
+    try:
+        for _ in range(calls):
+            op()
+    finally:
+        gc.callbacks.remove(callback)
+    scale = 10000 / calls
+    return len(pauses) * scale, sum(pauses) / 1000 * scale
+
+
+def run(scales):
+    results = {}
+    for scale in scales:
+        for name, op in make_cases(scale):
+            key = f"{name}@{scale}"
+            ns = time_op(op)
+            # about half a second of calls, at least 1000
+            collections, pause_us = gc_op(op, max(1000, int(5e8 / ns)))
+            results[key] = {"ns_per_op": ns, "alloc_bytes": alloc_op(op),
+                            "gc_per_10k": collections, "gc_us_per_10k": pause_us}
+            r = results[key]
+            print(f"{name:<10} {scale:>6} {r['ns_per_op']:>12.0f} {r['alloc_bytes']:>10.0f}"
+                  f" {collections:>8.1f} {pause_us:>10.0f}")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Return a list of regression descriptions (empty if none).
+    """
+    failures = []
+    for key, base in baseline.items():
+        now = results.get(key)
+        if now is None:
+            continue
+        if now["ns_per_op"] > base["ns_per_op"] * (1 + threshold):
+            failures.append(f"{key}: {now['ns_per_op']:.0f} ns/op vs "
+                            f"{base['ns_per_op']:.0f} baseline")
+        # small absolute slack: tracemalloc's own bookkeeping varies
+        if now["alloc_bytes"] > base["alloc_bytes"] * (1 + threshold) + 64:
+            failures.append(f"{key}: {now['alloc_bytes']:.0f} B/op vs "
+                            f"{base['alloc_bytes']:.0f} baseline")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="In-process micro-benchmarks of broker_osc.py hot functions")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES),
+                        help="pods and clients per run")
+    parser.add_argument("--save", metavar="PATH", help="write results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="baseline to check against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown / extra allocation as a fraction "
+                             "(default: 0.25)")
+    parser.add_argument("--profile", action="store_true",
+                        help="run with the broker's --profile stage timers on")
+    args = parser.parse_args()
+
+    global PROFILE
+    PROFILE = args.profile
+
+    print(f"{'Benchmark':<10} {'Scale':>6} {'ns/op':>12} {'B/op':>10}"
+          f" {'GC/10k':>8} {'GC us/10k':>10}")
+    print("-" * 61)
+    results = run(args.scales)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.threshold)
+        if failures:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for line in failures:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.compare}.")
+
+
+if __name__ == "__main__":
+    main()
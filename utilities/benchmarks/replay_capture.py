@@ -0,0 +1,179 @@
+#---------------------------------------------------------
+# CAFFEINE CAPTURE REPLAYER
+#   - Sends a pod capture (broker_osc.py --capture PATH)
+#     back into a broker's ESP32 port: with the captured
+#     timing, N times faster, or as fast as possible
+#   - --multiply K turns each captured pod into K virtual
+#     pods (/pod1-/pod3 x 10 -> /pod1-/pod30), each sent
+#     from its own UDP socket so SO_REUSEPORT workers see
+#     separate flows
+#   - Reports packets sent, achieved rate and, for timed
+#     replay, how far sends fell behind schedule
+#
+#   Usage:
+#     python replay_capture.py pods.cap              (1x)
+#     python replay_capture.py pods.cap --speed 4 --multiply 10
+#     python replay_capture.py pods.cap --speed 0 --loop 5
+#---------------------------------------------------------
+
+import argparse
+import re
+import socket
+import time
+
+from bench_common import percentile
+import pod_capture
+
+POD_ADDRESS = re.compile(rb"/pod(\d+)")
+MAX_SOCKETS = 256
+
+
+def _osc_string(b):
+    b += b"\0"
+    return b + b"\0" * (-len(b) % 4)
+
+
+def split_address(dgram):
+    """
+    Split a plain OSC message into (address, rest after the padded
+    address), or return None for bundles and malformed datagrams.
+    """
+    if dgram[:1] != b"/":
+        return None
+    end = dgram.find(b"\0")
+    if end < 0:
+        return None
+    return dgram[:end], dgram[(end + 4) & ~3:]
+
+
+class VirtualPods:
+    """
+    Maps (captured address, copy k) to the renamed OSC address bytes
+    and a send socket. Copy 0 keeps the captured name; /podN copies are
+    numbered past the highest captured pod, other addresses get "_k".
+    """
+
+    def __init__(self, records, multiply, max_sockets=MAX_SOCKETS):
+        numbers = []
+        for _t, dgram in records:
+            parts = split_address(dgram)
+            if parts:
+                m = POD_ADDRESS.fullmatch(parts[0])
+                if m:
+                    numbers.append(int(m.group(1)))
+        self.stride = max(numbers, default=0)
+        self.multiply = multiply
+        self.max_sockets = max_sockets
+        self.heads = {}
+        self.sockets = []
+        self.socket_of = {}
+
+    def target(self, address, k):
+        key = (address, k)
+        entry = self.heads.get(key)
+        if entry is None:
+            name = address
+            if k:
+                m = POD_ADDRESS.fullmatch(address)
+                if m and self.stride:
+                    name = b"/pod%d" % (int(m.group(1)) + k * self.stride)
+                else:
+                    name = address + b"_%d" % k
+            entry = (_osc_string(name), self._socket_for(name))
+            self.heads[key] = entry
+        return entry
+
+    def _socket_for(self, name):
+        sock = self.socket_of.get(name)
+        if sock is None:
+            if len(self.sockets) < self.max_sockets:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.sockets.append(sock)
+            else:
+                sock = self.sockets[len(self.socket_of) % self.max_sockets]
+            self.socket_of[name] = sock
+        return sock
+
+    def sends(self, dgram):
+        """
+        (socket, datagram) pairs for one captured datagram.
+        """
+        parts = split_address(dgram)
+        if parts is None:  # bundle: replay once, unchanged
+            return [(self.target(b"", 0)[1], dgram)]
+        address, rest = parts
+        out = []
+        for k in range(self.multiply):
+            head, sock = self.target(address, k)
+            out.append((sock, head + rest))
+        return out
+
+
+def replay(records, dest, speed=1.0, multiply=1, loops=1):
+    pods = VirtualPods(records, multiply)
+    if not records:
+        return {"sent": 0, "errors": 0, "elapsed": 0.0, "lag_ms": []}
+    span = records[-1][0] - records[0][0]
+    period = span + (span / max(1, len(records) - 1))  # loop spacing
+    first = records[0][0]
+
+    sent = errors = 0
+    lags = []
+    t0 = time.perf_counter()
+    for loop in range(loops):
+        for t, dgram in records:
+            if speed > 0:
+                due = t0 + (t - first + loop * period) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                lags.append(max(0.0, time.perf_counter() - due) * 1000.0)
+            for sock, data in pods.sends(dgram):
+                try:
+                    sock.sendto(data, dest)
+                    sent += 1
+                except OSError:
+                    errors += 1
+    elapsed = time.perf_counter() - t0
+    lags.sort()
+    return {"sent": sent, "errors": errors, "elapsed": elapsed, "lag_ms": lags,
+            "pods": len(pods.socket_of), "sockets": len(pods.sockets)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a broker_osc.py --capture file into a broker")
+    parser.add_argument("capture")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed: 1 = captured timing, N = N times "
+                             "faster, 0 = as fast as possible")
+    parser.add_argument("--multiply", type=int, default=1,
+                        help="virtual pods per captured pod")
+    parser.add_argument("--loop", type=int, default=1,
+                        help="replay the capture this many times")
+    args = parser.parse_args()
+    if args.multiply < 1 or args.loop < 1:
+        parser.error("--multiply and --loop must be at least 1")
+
+    start, records = pod_capture.read_capture(args.capture)
+    span = records[-1][0] - records[0][0] if records else 0.0
+    print(f"{args.capture}: {len(records)} datagrams over {span:.1f} s, "
+          f"captured {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start))}")
+    speed = "max" if args.speed <= 0 else f"{args.speed:g}x"
+    print(f"Replaying to {args.host}:{args.port} at {speed}, "
+          f"x{args.multiply} pods, {args.loop} loop(s)...")
+
+    r = replay(records, (args.host, args.port), args.speed, args.multiply, args.loop)
+    rate = r["sent"] / r["elapsed"] if r["elapsed"] > 0 else 0.0
+    print(f"Sent {r['sent']} datagrams from {r.get('pods', 0)} pods "
+          f"in {r['elapsed']:.2f} s ({rate:.0f} pkt/s, {r['errors']} send errors)")
+    if r["lag_ms"]:
+        lags = r["lag_ms"]
+        print(f"Behind schedule: p50 {percentile(lags, 0.50):.3f} ms, "
+              f"p99 {percentile(lags, 0.99):.3f} ms, max {lags[-1]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#---------------------------------------------------------
+# CAFFEINE SHARDED BROKER SCALING BENCHMARK
+#   - Runs broker_osc.py with --workers 1, 2, 4, 8 over
+#     loopback (default ports 5001 / 9001, so no other
+#     broker may be running)
+#   - Sender processes flood N pods, each from its own
+#     UDP socket, so SO_REUSEPORT can spread them across
+#     the workers
+#   - One subscriber registers, /connects to every pod
+#     and counts what the broker delivers
+#   - Reports delivered messages/s and p50/p99 latency
+#     per worker count
+#
+#   Usage:
+#     python shard_bench.py
+#     python shard_bench.py --workers 1 4 --pods 64
+#---------------------------------------------------------
+
+import argparse
+import multiprocessing as mp
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from bench_common import (BROKER_SCRIPT, elapsed_us, encode_pod_message,
+                          now_us, percentile)
+from pythonosc import osc_message, osc_message_builder
+
+DATA_ADDR = ("127.0.0.1", 5001)
+CONTROL_ADDR = ("127.0.0.1", 9001)
+
+
+def _run_sender(pod_names, duration, go):
+    socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in pod_names]
+    go.wait()
+    t_end = time.monotonic() + duration
+    seq = 0
+    while time.monotonic() < t_end:
+        for sock, name in zip(socks, pod_names):
+            try:
+                sock.sendto(encode_pod_message(name, seq, now_us()), DATA_ADDR)
+            except OSError:
+                pass
+        seq += 1
+
+
+def _control(sock, address, args):
+    sock.sendto(osc_message_builder.build_msg(address, args).dgram, CONTROL_ADDR)
+
+
+def run_workers(workers, pods, senders, duration):
+    broker = subprocess.Popen(
+        [sys.executable, BROKER_SCRIPT, "--workers", str(workers)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(1.0 + 0.2 * workers)
+
+        sub = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sub.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        sub.bind(("127.0.0.1", 0))
+        sub.settimeout(0.2)
+        _control(sub, "/register", [sub.getsockname()[1]])
+        names = [f"/pod{i + 1}" for i in range(pods)]
+        for name in names:
+            _control(sub, "/connect", [name])
+        time.sleep(0.5)
+        while True:  # drain the /broker confirmation
+            try:
+                sub.recv(65535)
+            except socket.timeout:
+                break
+
+        go = mp.Event()
+        procs = [mp.Process(target=_run_sender,
+                            args=(names[i::senders], duration, go), daemon=True)
+                 for i in range(senders)]
+        for p in procs:
+            p.start()
+        time.sleep(0.3)
+        go.set()
+
+        latencies = []
+        t_end = time.monotonic() + duration + 0.5
+        while time.monotonic() < t_end:
+            try:
+                data = sub.recv(65535)
+            except socket.timeout:
+                continue
+            if data.startswith(b"/pod"):
+                latencies.append(elapsed_us(osc_message.OscMessage(data).params[5]))
+        for p in procs:
+            p.join()
+    finally:
+        broker.terminate()
+        broker.wait()
+
+    latencies.sort()
+    return {
+        "workers": workers,
+        "delivered": len(latencies),
+        "rate": len(latencies) / duration,
+        "p50_ms": percentile(latencies, 0.50) / 1000.0,
+        "p99_ms": percentile(latencies, 0.99) / 1000.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Throughput scaling of the sharded broker")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pods", type=int, default=32)
+    parser.add_argument("--senders", type=int, default=2,
+                        help="sender processes sharing the pods")
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{args.pods} pods flooded by {args.senders} sender processes, "
+          f"{args.duration:.0f} s per run, {os.cpu_count()} CPUs\n")
+    print(f"{'Workers':<8} {'Delivered':>10} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    print("-" * 47)
+    for workers in args.workers:
+        r = run_workers(workers, args.pods, args.senders, args.duration)
+        print(f"{r['workers']:<8} {r['delivered']:>10} {r['rate']:>9.0f} "
+              f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
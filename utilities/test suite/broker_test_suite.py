@@ -1,11 +1,16 @@
 
-import csv
+import os
+import sys
 import time
-from datetime import datetime
 from pythonosc import dispatcher, osc_server, udp_client
 from pythonosc.osc_message_builder import OscMessageBuilder
 import threading
 
+# Shared binary logger lives next to the broker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "osc_programs"))
+import caffeine_binlog
+
 HOST = '0.0.0.0'
 ESP32_PORT = 5001
 BROKER_OSC_PORT = 9001
@@ -14,12 +19,10 @@ pod_clients = {}
 forward_clients = {}
 message_stats = {}
 
-logfile = open("broker_log.csv", "w", newline='')
-csv_writer = csv.writer(logfile)
-csv_writer.writerow([
-    "system_time", "pod", "remote_timestamp", "latency_ms",
-    "sequence_number", "dropped_in_interval", "dropped_total", "loss_percent"
-])
+# Rows are queued and written by a background thread as broker_log.NNNN.cbl;
+# convert with: python osc_programs/caffeine_binlog.py broker_log
+# (gives broker_log.csv in the original column layout)
+log = caffeine_binlog.BinaryLogger("broker_log", caffeine_binlog.BROKER_TEST_COLUMNS)
 
 def osc_sensor_data_handler(address, *args):
     pod_name = address
@@ -45,11 +48,8 @@ def osc_sensor_data_handler(address, *args):
     stats["count"] += 1
     loss_percent = (stats["dropped_total"] / stats["expected_seq"]) * 100
 
-    csv_writer.writerow([
-        datetime.now().isoformat(), pod_name, remote_timestamp, round(latency * 1000, 3),
-        sequence_number, dropped, stats["dropped_total"], round(loss_percent, 3)
-    ])
-    logfile.flush()
+    log.log((now, pod_name, remote_timestamp, latency * 1000,
+             sequence_number, dropped, stats["dropped_total"], loss_percent))
 
     print(f"[{pod_name}] Seq: {sequence_number} | Latency: {latency*1000:.2f} ms | "
           f"Lost: {dropped} | Total Lost: {stats['dropped_total']} ({loss_percent:.2f}%)")
@@ -111,4 +111,9 @@ def start_osc_registration_server():
 
 if __name__ == "__main__":
     threading.Thread(target=start_osc_esp32_server, daemon=True).start()
-    start_osc_registration_server()
+    try:
+        start_osc_registration_server()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
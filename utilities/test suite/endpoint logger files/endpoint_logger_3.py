@@ -1,12 +1,17 @@
 
-import csv
+import os
+import sys
 import time
-from datetime import datetime
 from pythonosc.dispatcher import Dispatcher
 from pythonosc.osc_server import ThreadingOSCUDPServer
 from pythonosc.udp_client import SimpleUDPClient
 import socket
 
+# Shared binary logger lives next to the broker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "..", "osc_programs"))
+import caffeine_binlog
+
 # CONFIGURATION
 BROKER_IP = "192.168.1.2"       # Replace with your broker's IP
 BROKER_PORT = 9001              # Port the broker listens on
@@ -21,12 +26,10 @@ client = SimpleUDPClient(BROKER_IP, BROKER_PORT)
 client.send_message("/forwardregister", [POD_NAME, local_ip, LISTEN_PORT])
 print(f"Sent forward registration for {POD_NAME} to {BROKER_IP}:{BROKER_PORT} from {local_ip}:{LISTEN_PORT}")
 
-# Open CSV file for logging
-logfile = open("endpoint_log_pod3.csv", "w", newline='')
-csv_writer = csv.writer(logfile)
-csv_writer.writerow([
-    "system_time", "remote_timestamp", "latency_ms", "sequence_number"
-])
+# Binary log, written by a background thread as endpoint_log_pod3.NNNN.cbl;
+# convert with: python osc_programs/caffeine_binlog.py endpoint_log_pod3
+# (gives endpoint_log_pod3.csv in the original column layout)
+log = caffeine_binlog.BinaryLogger("endpoint_log_pod3", caffeine_binlog.ENDPOINT_COLUMNS)
 
 message_count = 0
 
@@ -54,14 +57,8 @@ def handler(address, *args):
         #if latency < 0 or latency > 10:
         #    print(f"⚠️ Suspicious latency: {latency:.3f}s — check NTP sync")
 
-        # Log to CSV
-        csv_writer.writerow([
-            datetime.now().isoformat(),
-            remote_timestamp,
-            round(latency * 1000, 3),
-            sequence_number
-        ])
-        logfile.flush()
+        # Log (queued; written off the handler thread)
+        log.log((now, remote_timestamp, latency * 1000, sequence_number))
 
         print(f"[{POD_NAME}] #{message_count} | Seq: {sequence_number} | Latency: {latency*1000:.2f} ms")
 
@@ -74,4 +71,9 @@ dispatcher.map(POD_NAME, handler)
 
 server = ThreadingOSCUDPServer(("0.0.0.0", LISTEN_PORT), dispatcher)
 print(f"Listening on port {LISTEN_PORT} for messages to {POD_NAME}...")
-server.serve_forever()
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    log.close()
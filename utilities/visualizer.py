@@ -1,12 +1,25 @@
 #---------------------------------------------------------
-# CAFFEINE POD LIVE VISUALIZER (Yaw wrapped ±360°)
-# - Fix: ignore non-selected addresses (e.g., /pod_list)
-# - Fix: robust numeric filtering to avoid strings in plot
-# - Distance axis set to 0..200
+# CAFFEINE POD LIVE VISUALIZER (v2)
+# - Current broker protocol: /register recvPort, /list,
+#   /connect pod ... (replies arrive on /broker)
+# - Several pods in one window: one colored line per pod
+#   in each of the six value plots
+# - Every received sample is written into a preallocated
+#   per-pod ring buffer (no np.roll, nothing reallocated
+#   per frame); the plots sweep like a scope, with a gap
+#   at each pod's write position
+# - Blitted redraws; Yaw wrapped ±360°; Distance 0..200
+#
+#   Usage:
+#     python visualizer.py                  (pick from /list)
+#     python visualizer.py /pod1 /pod2
+#     python visualizer.py "/pod*" --broker-ip 192.168.1.2
 #---------------------------------------------------------
 
-from pythonosc import dispatcher, osc_server, udp_client
-import threading, time
+from pythonosc import dispatcher, osc_server
+from pythonosc.osc_message_builder import build_msg
+import argparse
+import threading
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import numpy as np
@@ -15,97 +28,189 @@ BROKER_IP = "127.0.0.1"      # adjust if broker runs elsewhere
 BROKER_PORT = 9001           # matches BROKER_OSC_PORT
 CLIENT_PORT = 10001          # local port to receive OSC data
 
-pod_list = []
-selected_pod = None
-latest_values = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+SAMPLE_RATE = 100            # Hz, pods send every 10 ms
+WINDOW_SECONDS = 5.0         # visible history per pod
+FRAME_INTERVAL_MS = 50       # redraw period
+
 fields = ["Roll", "Pitch", "Yaw", "Sound", "Distance", "Light"]
+y_limits = [(-200, 200), (-200, 200), (-400, 400), (0, 4100), (0, 200), (0, 4100)]
 
-def handle_pod_list(address, *args):
-    global pod_list
-    pod_list = list(args)
-    print("Available pods:", pod_list)
+pod_list = []
+pod_list_received = threading.Event()
+registered = threading.Event()
 
-def _is_num(x):
-    return isinstance(x, (int, float, np.number))
+# pod name -> PodRing, created when the pod's first sample arrives
+rings = {}
+rings_lock = threading.Lock()
 
-def handle_sensor_data(address, *args):
-    # Only accept data for the chosen pod; ignore /pod_list and other traffic
-    global latest_values, selected_pod
-    if selected_pod is None or address != selected_pod:
-        return
 
-    values = list(args)
-    nums = [float(v) for v in values if _is_num(v)]
-    if len(nums) < 6:
-        return
+class PodRing:
+    """
+    Preallocated (capacity x 6) sample buffer for one pod. The slot
+    after the newest sample is kept NaN, so the plotted line breaks
+    at the write position instead of joining newest to oldest.
+    """
 
-    vals = nums[:6]
+    def __init__(self, capacity):
+        self.values = np.full((capacity, len(fields)), np.nan)
+        self.capacity = capacity
+        self.next = 0
+        self.count = 0
 
-    # Wrap yaw (index 2) to ±360 degrees
-    yaw = vals[2]
-    yaw = ((yaw + 360.0) % 720.0) - 360.0
-    vals[2] = yaw
+    def write(self, vals):
+        i = self.next
+        self.values[i] = vals
+        self.next = (i + 1) % self.capacity
+        self.values[self.next] = np.nan
+        self.count += 1
 
-    latest_values = vals
 
-def request_pod_list():
-    client = udp_client.SimpleUDPClient(BROKER_IP, BROKER_PORT)
-    client.send_message("/list", [BROKER_IP, CLIENT_PORT])
+def _is_num(x):
+    return isinstance(x, (int, float, np.number))
 
-def register_for_pod(pod_name):
-    client = udp_client.SimpleUDPClient(BROKER_IP, BROKER_PORT)
-    client.send_message("/register", [pod_name, BROKER_IP, CLIENT_PORT])
-    print(f"Registered for {pod_name}")
 
-def start_listener():
+def handle_broker(address, *args):
+    global pod_list
+    if not args:
+        return
+    if args[0] == "registered":
+        registered.set()
+    elif args[0] == "pod_list":
+        pod_list = list(args[1:])
+        pod_list_received.set()
+
+
+def make_sensor_handler(capacity):
+    def handle_sensor_data(address, *args):
+        if address == "/broker":
+            return
+        nums = [float(v) for v in args if _is_num(v)]
+        if len(nums) < 6:
+            return
+        vals = nums[:6]
+
+        # Wrap yaw (index 2) to ±360 degrees
+        vals[2] = ((vals[2] + 360.0) % 720.0) - 360.0
+
+        ring = rings.get(address)
+        if ring is None:
+            with rings_lock:
+                ring = rings.setdefault(address, PodRing(capacity))
+        ring.write(vals)
+    return handle_sensor_data
+
+
+def start_listener(port, capacity):
+    """
+    One socket for everything: control messages go out from the
+    receive port, so the broker's replies and data come back to it.
+    """
     disp = dispatcher.Dispatcher()
-    disp.map("/pod_list", handle_pod_list)
-    disp.map("/*", handle_sensor_data)
-    server = osc_server.ThreadingOSCUDPServer(("0.0.0.0", CLIENT_PORT), disp)
-    print(f"Listening locally for OSC on {CLIENT_PORT}...")
+    disp.map("/broker", handle_broker)
+    disp.map("/*", make_sensor_handler(capacity))
+    server = osc_server.BlockingOSCUDPServer(("0.0.0.0", port), disp)
+    print(f"Listening locally for OSC on {port}...")
     threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
 
-def main():
-    global selected_pod
-    start_listener()
-    request_pod_list()
-    time.sleep(1)
-    if not pod_list:
+
+def send_control(server, broker, address, args):
+    server.socket.sendto(build_msg(address, args).dgram, broker)
+
+
+def choose_pods(server, broker):
+    send_control(server, broker, "/list", [])
+    if not pod_list_received.wait(2.0) or not pod_list:
         print("No pods found.")
-        return
+        return []
     print("\nAvailable pods:", pod_list)
-    pod = input("Enter pod name to visualize (e.g. /pod1): ").strip()
-    if pod not in pod_list:
-        print(f"{pod} not found.")
-        return
-    selected_pod = pod
-    register_for_pod(pod)
+    answer = input("Enter pod names to visualize (e.g. /pod1 /pod2, "
+                   "or Enter for all): ").replace(",", " ").split()
+    pods = answer or list(pod_list)
+    missing = [p for p in pods if p not in pod_list and "*" not in p and "[" not in p]
+    if missing:
+        print(f"Not found: {' '.join(missing)}")
+        return []
+    return pods
+
 
+def run_plot(capacity):
     fig, ax = plt.subplots(3, 2, figsize=(10, 6))
     ax = ax.flatten()
-    window = 200
-    data = [np.zeros(window, dtype=float) for _ in range(6)]
-    lines = []
+    x = np.arange(capacity) / SAMPLE_RATE
     for i in range(6):
-        lines.append(ax[i].plot(data[i])[0])
         ax[i].set_title(fields[i])
-        if i < 3:             # Roll, Pitch, Yaw
-            ax[i].set_ylim([-200, 200])
-        elif i == 4:          # Distance sensor
-            ax[i].set_ylim([0, 200])
-        else:                 # Sound and Light
-            ax[i].set_ylim([0, 4100])
+        ax[i].set_xlim(0, x[-1])
+        ax[i].set_ylim(y_limits[i])
     plt.tight_layout()
 
-    def update(_):
-        for i in range(6):
-            data[i] = np.roll(data[i], -1)
-            data[i][-1] = latest_values[i]
-            lines[i].set_ydata(data[i])
-        return lines
+    # pod name -> six Line2D, added as pods start sending. The legend
+    # is animated too, so adding a pod never invalidates the blit
+    # background.
+    lines = {}
+    artists = []
+    legend = []
+
+    def add_pod(name):
+        color = f"C{len(lines) % 10}"
+        ring = rings[name]
+        lines[name] = [ax[i].plot(x, ring.values[:, i], color=color, lw=1,
+                                  animated=True, label=name)[0]
+                       for i in range(6)]
+        artists.extend(lines[name])
+        if legend:
+            artists.remove(legend.pop())
+        legend.append(ax[0].legend(loc="upper right", fontsize="small"))
+        legend[0].set_animated(True)
+        artists.append(legend[0])
 
-    ani = animation.FuncAnimation(fig, update, interval=100, blit=True)
+    def update(_):
+        for name in list(rings):
+            if name not in lines:
+                add_pod(name)
+        # Hand each line a view of its ring-buffer column; the buffers
+        # are never rolled or reallocated
+        for name, pod_lines in lines.items():
+            values = rings[name].values
+            for i, line in enumerate(pod_lines):
+                line.set_ydata(values[:, i])
+        return artists
+
+    ani = animation.FuncAnimation(fig, update, interval=FRAME_INTERVAL_MS,
+                                  blit=True, cache_frame_data=False)
     plt.show()
+    return ani
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CAFFEINE pod live visualizer")
+    parser.add_argument("pods", nargs="*",
+                        help="pod names or patterns (default: choose from /list)")
+    parser.add_argument("--broker-ip", default=BROKER_IP)
+    parser.add_argument("--broker-port", type=int, default=BROKER_PORT)
+    parser.add_argument("--port", type=int, default=CLIENT_PORT,
+                        help="local OSC receive port")
+    parser.add_argument("--window", type=float, default=WINDOW_SECONDS,
+                        help="seconds of samples shown per pod")
+    args = parser.parse_args()
+
+    broker = (args.broker_ip, args.broker_port)
+    capacity = max(2, int(args.window * SAMPLE_RATE))
+    server = start_listener(args.port, capacity)
+
+    send_control(server, broker, "/register", [args.port])
+    if not registered.wait(2.0):
+        print(f"No reply from broker at {broker[0]}:{broker[1]}.")
+        return
+
+    pods = args.pods or choose_pods(server, broker)
+    if not pods:
+        return
+    send_control(server, broker, "/connect", pods)
+    print(f"Connected to {' '.join(pods)}")
+
+    run_plot(capacity)
+
 
 if __name__ == "__main__":
     main()